@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 import os
 
 from app.extensions import db
+from app import metrics
 from app.clickHouse import clickHouse_BP
 from app.pullReddit import pullReddit_BP
 from app.searchHistory import searchHistory_BP
@@ -17,7 +18,8 @@ def create_app():
         f"http://{ch_host}",
         "http://localhost:8001",                  # local dev (Vite)
         "http://localhost"                        # local dev (nginx)
-    ]}})
+    ]}}, expose_headers=["X-Next-Cursor", "X-Cache", "X-Arrow-Compression",
+                         "X-Sample", "X-Sample-Seed", "X-Sample-Population"])
 
     load_dotenv()
     app.config.from_prefixed_env()
@@ -28,5 +30,6 @@ def create_app():
     app.register_blueprint(clickHouse_BP)
     app.register_blueprint(pullReddit_BP)
     app.register_blueprint(searchHistory_BP)
+    metrics.init_app(app)
 
     return app
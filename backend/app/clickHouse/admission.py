@@ -0,0 +1,89 @@
+import os
+import time
+import uuid
+
+import app.redis_client as redis
+from .estimate import estimated_rows
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# Queries estimated to read more rows than this count as heavy and need a slot.
+ADMISSION_HEAVY_ROWS = int(os.getenv("ADMISSION_HEAVY_ROWS", 5_000_000))
+# Heavy queries allowed at once across all workers; kept below the gunicorn worker
+# count so cheap endpoints such as /api/progress always find a free worker.
+ADMISSION_MAX_HEAVY = int(os.getenv("ADMISSION_MAX_HEAVY", 2))
+ADMISSION_MAX_HEAVY_PER_CLIENT = int(os.getenv("ADMISSION_MAX_HEAVY_PER_CLIENT", 1))
+# How long a heavy request waits for a slot before it is rejected with 429.
+ADMISSION_QUEUE_SECONDS = float(os.getenv("ADMISSION_QUEUE_SECONDS", 3))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 10))
+# Slots of workers that died without releasing them expire after this long.
+ADMISSION_SLOT_TTL_SECONDS = int(os.getenv("ADMISSION_SLOT_TTL_SECONDS", 30 * 60))
+ADMISSION_POLL_SECONDS = 0.25
+
+
+class AdmissionRejectedError(Exception):
+    """
+    A heavy query could not get a slot within ADMISSION_QUEUE_SECONDS.
+    """
+
+    def __init__(self, message, retry_after=ADMISSION_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def admit(client, query, parameters, client_id, settings=None):
+    """
+    Estimate `query` and, if it is heavy, wait for a heavy-query slot for `client_id`.
+    Returns a ticket to pass to release() (None for light queries). Raises
+    AdmissionRejectedError when no slot frees up in time.
+    """
+    if not ADMISSION_ENABLED:
+        return None
+    try:
+        rows = estimated_rows(client, query, parameters, settings)
+    except Exception as e:
+        # Without an estimate, treat the query as heavy rather than let it through.
+        print(f"Query estimate failed, treating it as heavy: {e}", flush=True)
+        rows = None
+    if rows is not None and rows <= ADMISSION_HEAVY_ROWS:
+        return None
+
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + ADMISSION_QUEUE_SECONDS
+    while True:
+        refused = redis.acquire_admission_slot(
+            client_id, token, ADMISSION_MAX_HEAVY, ADMISSION_MAX_HEAVY_PER_CLIENT, ADMISSION_SLOT_TTL_SECONDS
+        )
+        if not refused:
+            return client_id, token
+        if time.monotonic() >= deadline:
+            if refused == "client":
+                message = (f"You already have {ADMISSION_MAX_HEAVY_PER_CLIENT} large quer"
+                           f"{'y' if ADMISSION_MAX_HEAVY_PER_CLIENT == 1 else 'ies'} running; "
+                           f"wait for it to finish or narrow the filters.")
+            else:
+                message = "The server is busy with other large queries; try again shortly."
+            raise AdmissionRejectedError(message)
+        time.sleep(ADMISSION_POLL_SECONDS)
+
+
+def release(ticket):
+    """
+    Give back the slot taken by admit(). Safe to call with None or more than once.
+    """
+    if ticket is None:
+        return
+    try:
+        redis.release_admission_slot(*ticket)
+    except Exception as e:
+        print(f"Admission slot release failed: {e}", flush=True)
+
+
+def stats():
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "heavy_rows": ADMISSION_HEAVY_ROWS,
+        "max_heavy": ADMISSION_MAX_HEAVY,
+        "max_heavy_per_client": ADMISSION_MAX_HEAVY_PER_CLIENT,
+        "queue_seconds": ADMISSION_QUEUE_SECONDS,
+        **redis.get_admission_counts()
+    }
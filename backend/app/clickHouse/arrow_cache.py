@@ -0,0 +1,340 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+import app.redis_client as redis
+
+ARROW_CACHE_ENABLED = os.getenv("ARROW_CACHE_ENABLED", "true").lower() == "true"
+ARROW_CACHE_DIR = os.getenv("ARROW_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ocss_arrow_cache"))
+# Total disk budget for cached results; least recently used files are evicted past it.
+ARROW_CACHE_MAX_BYTES = int(os.getenv("ARROW_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+# Results larger than this are streamed to the client but never cached.
+ARROW_CACHE_MAX_ENTRY_BYTES = int(os.getenv("ARROW_CACHE_MAX_ENTRY_BYTES", 4 * 1024 ** 3))
+# Shared secret /api/arrow_cache/invalidate requires as "Authorization: Bearer <token>"
+# (insert_data.py sends the same CACHE_INVALIDATE_TOKEN). Unset disables the endpoint.
+ARROW_CACHE_INVALIDATE_TOKEN = os.getenv("CACHE_INVALIDATE_TOKEN", "")
+
+# Concurrent misses for the same key share one ClickHouse query: the first worker to
+# claim the key runs it and spills the stream to disk, the others tail the spill file.
+# The leader renews its lease from a heartbeat thread until the flight is finished, so
+# a slow first block does not look like a dead leader; followers give up once it lapses.
+FLIGHT_LEASE_SECONDS = int(os.getenv("ARROW_FLIGHT_LEASE_SECONDS", 30))
+# Finished flights are remembered this long so slow followers can tell "done" from "lost".
+FLIGHT_RESULT_TTL_SECONDS = 10 * 60
+FLIGHT_POLL_SECONDS = 0.05
+TAIL_CHUNK_BYTES = 1024 * 1024
+
+# Stop events of the heartbeats this worker runs, keyed by spill path.
+_heartbeats = {}
+_heartbeats_lock = threading.Lock()
+
+CACHE_SUFFIX = ".arrows"
+# Extra headers of a cached result (the sample population) live in Redis this long;
+# past it a hit recomputes them.
+HEADERS_TTL_SECONDS = 7 * 24 * 3600
+
+
+def _cache_dir():
+    os.makedirs(ARROW_CACHE_DIR, exist_ok=True)
+    return ARROW_CACHE_DIR
+
+
+def _entry_path(key):
+    return os.path.join(_cache_dir(), key + CACHE_SUFFIX)
+
+
+def cache_key(params: dict):
+    """
+    Hash the normalized query parameters together with the ingest generation of the
+    subreddit they read, so invalidating a subreddit makes its old entries unreachable.
+    """
+    normalized = {
+        name: (value.strip() if isinstance(value, str) else value)
+        for name, value in params.items()
+        if value not in (None, "", [])
+    }
+    normalized["generation"] = redis.get_cache_generation(normalized.get("subreddit", ""))
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def lookup(key):
+    """
+    Return the path of a cached Arrow IPC stream for `key`, or None on a miss.
+    Hits refresh the file's mtime, which is what LRU eviction orders by.
+    """
+    path = _entry_path(key)
+    try:
+        os.utime(path, None)
+    except FileNotFoundError:
+        redis.incr_cache_counter("misses")
+        return None
+    redis.incr_cache_counter("hits")
+    return path
+
+
+def save_headers(key, headers):
+    """
+    Store the extra response headers that belong to the result cached under `key`.
+    """
+    if key and headers:
+        redis.set_cache_headers(key, headers, HEADERS_TTL_SECONDS)
+
+
+def cached_headers(key):
+    """
+    Headers stored by save_headers() for `key`, or None.
+    """
+    return redis.get_cache_headers(key) if key else None
+
+
+def _spill_path(key):
+    return f"{_entry_path(key)}.{os.getpid()}.{time.time_ns()}.tmp"
+
+
+def tee(key, chunks, spill_path=None):
+    """
+    Yield `chunks` unchanged while writing them to a temporary file. The file only
+    becomes visible as a cache entry once the stream has been fully consumed;
+    abandoned or oversized streams leave nothing behind.
+
+    With the `spill_path` returned by lead() the file is flushed after every chunk
+    for followers, kept past the entry size limit while they may be reading it,
+    and the flight is marked done or failed when the stream ends.
+    """
+    final_path = _entry_path(key)
+    tmp_path = spill_path or _spill_path(key)
+    fh = open(tmp_path, "wb")
+    written = 0
+    completed = False
+    try:
+        for chunk in chunks:
+            if fh is not None:
+                written += len(chunk)
+                if written > ARROW_CACHE_MAX_ENTRY_BYTES and not spill_path:
+                    fh.close()
+                    fh = None
+                    os.remove(tmp_path)
+                else:
+                    fh.write(chunk)
+                    if spill_path:
+                        fh.flush()
+            yield chunk
+        completed = fh is not None
+    finally:
+        if fh is not None:
+            fh.close()
+            if spill_path:
+                _finish_flight(key, spill_path, "done" if completed else "failed")
+            if completed and written <= ARROW_CACHE_MAX_ENTRY_BYTES:
+                os.replace(tmp_path, final_path)
+                evict()
+            else:
+                # Followers that already opened the spill keep reading their descriptor.
+                os.remove(tmp_path)
+
+
+def lead(key):
+    """
+    Try to become the one worker that runs the query for `key`. Returns the spill
+    path to pass to tee(), or None when another worker already holds the flight.
+    The lease is kept alive in the background until the flight is finished.
+    """
+    spill_path = _spill_path(key)
+    # Create the file before publishing the claim so followers can always open it.
+    open(spill_path, "wb").close()
+    try:
+        if redis.claim_flight(key, spill_path, FLIGHT_LEASE_SECONDS):
+            _start_heartbeat(key, spill_path)
+            return spill_path
+    except Exception:
+        os.remove(spill_path)
+        raise
+    os.remove(spill_path)
+    return None
+
+
+def _start_heartbeat(key, spill_path):
+    """
+    Renew the flight's lease every third of FLIGHT_LEASE_SECONDS, whether or not the
+    query has sent anything yet, until _finish_flight() stops it or the flight is
+    no longer ours.
+    """
+    stop = threading.Event()
+    with _heartbeats_lock:
+        _heartbeats[spill_path] = stop
+
+    def run():
+        while not stop.wait(FLIGHT_LEASE_SECONDS / 3):
+            try:
+                if not redis.update_flight(key, spill_path, "running", FLIGHT_LEASE_SECONDS):
+                    break
+            except Exception as e:
+                print(f"Arrow flight {key[:12]} lease renewal failed: {e}", flush=True)
+        with _heartbeats_lock:
+            if _heartbeats.get(spill_path) is stop:
+                del _heartbeats[spill_path]
+
+    threading.Thread(target=run, name=f"arrow-flight-{key[:12]}", daemon=True).start()
+
+
+def _stop_heartbeat(spill_path):
+    with _heartbeats_lock:
+        stop = _heartbeats.pop(spill_path, None)
+    if stop is not None:
+        stop.set()
+
+
+def abandon(key, spill_path):
+    """
+    Give up a flight whose stream never started, so followers stop waiting for it.
+    Does nothing once tee() has finished the flight.
+    """
+    if _finish_flight(key, spill_path, "failed"):
+        try:
+            os.remove(spill_path)
+        except FileNotFoundError:
+            pass
+
+
+def _finish_flight(key, spill_path, state):
+    _stop_heartbeat(spill_path)
+    try:
+        return redis.update_flight(key, spill_path, state, FLIGHT_RESULT_TTL_SECONDS)
+    except Exception as e:
+        print(f"Arrow flight {key[:12]} could not be marked {state}: {e}", flush=True)
+        return False
+
+
+def follow(key):
+    """
+    Join a query another worker is already running for `key`. Returns an iterator
+    over the leader's Arrow stream, or None when there is nothing to follow.
+    """
+    flight = redis.get_flight(key)
+    if not flight or flight["state"] == "failed":
+        return None
+    try:
+        fh = open(flight["path"], "rb")
+    except FileNotFoundError:
+        # The leader finished between the two reads and renamed its spill into place.
+        try:
+            fh = open(_entry_path(key), "rb")
+        except FileNotFoundError:
+            return None
+        redis.incr_cache_counter("coalesced")
+        return _read_file(fh)
+    redis.incr_cache_counter("coalesced")
+    return _tail(key, flight["path"], fh)
+
+
+def _read_file(fh):
+    with fh:
+        while True:
+            chunk = fh.read(TAIL_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _tail(key, spill_path, fh):
+    """
+    Yield the leader's spill file as it grows until the flight is done. Raises if the
+    leader fails or its lease lapses, which cuts the follower's response short.
+    """
+    with fh:
+        while True:
+            chunk = fh.read(TAIL_CHUNK_BYTES)
+            if chunk:
+                yield chunk
+                continue
+            flight = redis.get_flight(key)
+            if flight is not None and flight["path"] != spill_path:
+                flight = None
+            if flight is None and os.path.exists(_entry_path(key)):
+                # The finished record expired while this follower was blocked on its client.
+                flight = {"state": "done"}
+            if flight is None or flight["state"] == "failed":
+                raise RuntimeError("The shared query for this result was abandoned.")
+            if flight["state"] == "done":
+                yield from _read_file(fh)
+                return
+            time.sleep(FLIGHT_POLL_SECONDS)
+
+
+def evict(max_bytes=None):
+    """
+    Delete least recently used entries until the cache fits in `max_bytes`.
+    """
+    max_bytes = ARROW_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    with os.scandir(_cache_dir()) as it:
+        for entry in it:
+            if not entry.name.endswith(CACHE_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def invalidation_authorized(authorization):
+    """
+    Check an Authorization header against ARROW_CACHE_INVALIDATE_TOKEN.
+    """
+    if not ARROW_CACHE_INVALIDATE_TOKEN:
+        return False
+    scheme, _, token = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip(), ARROW_CACHE_INVALIDATE_TOKEN)
+
+
+def invalidate(subreddits=None):
+    """
+    Drop cached results after new data is ingested. With no subreddits every
+    entry is invalidated.
+    """
+    redis.bump_cache_generation(subreddits or [])
+
+
+def stats():
+    """
+    Hit/miss counters (shared by all workers) plus the current size on disk.
+    """
+    entries = 0
+    size = 0
+    with os.scandir(_cache_dir()) as it:
+        for entry in it:
+            if entry.name.endswith(CACHE_SUFFIX):
+                try:
+                    size += entry.stat().st_size
+                except FileNotFoundError:
+                    continue
+                entries += 1
+
+    counters = redis.get_cache_counters()
+    return {
+        "enabled": ARROW_CACHE_ENABLED,
+        "hits": counters.get("hits", 0),
+        "misses": counters.get("misses", 0),
+        "coalesced": counters.get("coalesced", 0),
+        "entries": entries,
+        "bytes": size,
+        "max_bytes": ARROW_CACHE_MAX_BYTES
+    }
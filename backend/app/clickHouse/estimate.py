@@ -0,0 +1,101 @@
+import os
+
+# Projected topic job time: a fixed part (model loading, UMAP/HDBSCAN setup, LLM topic
+# labels) plus a per-row part dominated by embedding. Tune to the GPU host.
+TOPIC_JOB_BASE_SECONDS = float(os.getenv("TOPIC_JOB_BASE_SECONDS", 180))
+TOPIC_JOB_SECONDS_PER_ROW = float(os.getenv("TOPIC_JOB_SECONDS_PER_ROW", 0.002))
+# Topic jobs projected to run longer than this are flagged and get a suggested sample.
+TOPIC_JOB_WARN_SECONDS = float(os.getenv("TOPIC_JOB_WARN_SECONDS", 30 * 60))
+
+TABLE_STATS_QUERY = (
+    "SELECT table, sum(rows), sum(data_compressed_bytes), sum(data_uncompressed_bytes) "
+    "FROM system.parts "
+    "WHERE active AND database = currentDatabase() AND table IN {tables:Array(String)} "
+    "GROUP BY table"
+)
+
+
+def explain_estimate(client, query, parameters=None, settings=None):
+    """
+    Per-table {"rows", "parts", "marks"} ClickHouse expects to read for `query`, from
+    EXPLAIN ESTIMATE. Only partition and primary-key pruning is applied, so rows are
+    whole granules and ignore other filters: an upper bound, at no scan cost.
+    """
+    result = client.query(f"EXPLAIN ESTIMATE {query}", parameters=parameters, settings=settings)
+    columns = list(result.column_names)
+    tables = {}
+    for row in result.result_rows:
+        record = dict(zip(columns, row))
+        entry = tables.setdefault(record["table"], {"rows": 0, "parts": 0, "marks": 0})
+        for name in entry:
+            entry[name] += int(record[name])
+    return tables
+
+
+def estimated_rows(client, query, parameters=None, settings=None):
+    return sum(entry["rows"] for entry in explain_estimate(client, query, parameters, settings).values())
+
+
+def table_stats(client, tables):
+    """
+    Rows and compressed/uncompressed bytes of each table's active parts.
+    """
+    result = client.query(TABLE_STATS_QUERY, parameters={"tables": list(tables)})
+    return {
+        table: {"rows": int(rows), "compressed_bytes": int(compressed), "uncompressed_bytes": int(uncompressed)}
+        for table, rows, compressed, uncompressed in result.result_rows
+    }
+
+
+def sampled_rows(rows, sample):
+    """
+    Rows left after a parse_sample() sample is applied to `rows`.
+    """
+    if not sample:
+        return rows
+    if sample[0] == "fraction":
+        return int(rows * sample[1])
+    return min(rows, sample[1])
+
+
+def topic_job_seconds(rows):
+    return TOPIC_JOB_BASE_SECONDS + rows * TOPIC_JOB_SECONDS_PER_ROW
+
+
+def estimate_dataset(client, query, parameters, tables, sample=None, settings=None):
+    """
+    Size of a dataset query without running it: EXPLAIN ESTIMATE rows per table,
+    scaled by each table's bytes per row from system.parts, plus the projected topic
+    job time and, for long jobs, the largest sample that fits TOPIC_JOB_WARN_SECONDS.
+    """
+    per_table = explain_estimate(client, query, parameters, settings)
+    stats = table_stats(client, tables)
+
+    rows = compressed = uncompressed = 0
+    for table, entry in per_table.items():
+        rows += entry["rows"]
+        table_total = stats.get(table)
+        if table_total and table_total["rows"]:
+            share = entry["rows"] / table_total["rows"]
+            entry["compressed_bytes"] = int(table_total["compressed_bytes"] * share)
+            entry["uncompressed_bytes"] = int(table_total["uncompressed_bytes"] * share)
+            compressed += entry["compressed_bytes"]
+            uncompressed += entry["uncompressed_bytes"]
+
+    job_rows = sampled_rows(rows, sample)
+    seconds = topic_job_seconds(job_rows)
+    suggested_sample = None
+    if seconds > TOPIC_JOB_WARN_SECONDS:
+        suggested_sample = max(1, int((TOPIC_JOB_WARN_SECONDS - TOPIC_JOB_BASE_SECONDS) / TOPIC_JOB_SECONDS_PER_ROW))
+
+    return {
+        "rows": rows,
+        "exact": False,
+        "compressed_bytes": compressed,
+        "uncompressed_bytes": uncompressed,
+        "tables": per_table,
+        "sampled_rows": job_rows,
+        "topic_job_seconds": round(seconds),
+        "topic_job_warning": seconds > TOPIC_JOB_WARN_SECONDS,
+        "suggested_sample": suggested_sample
+    }
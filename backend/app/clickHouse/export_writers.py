@@ -0,0 +1,248 @@
+import io
+import os
+import csv
+import json
+import tempfile
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+# Finished export files; shared between the export worker and the web containers.
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "ocss_exports"))
+
+# format -> (file extension, mimetype)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "json": (".json", "application/json"),
+    "ndjson": (".ndjson", "application/x-ndjson"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.stream"),
+    "excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+# Timezone Excel exports are written in (Excel has no timezone-aware dates).
+# Callers can override it per export with ?timezone=.
+EXPORT_TIMEZONE = os.getenv("EXPORT_TIMEZONE", "America/New_York")
+EXCEL_SHEET_TITLE = "Reddit Export"
+# Excel's per-sheet limit, including the header row.
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_CELL_CHARS = 32767
+# Control characters openpyxl refuses to write.
+EXCEL_ILLEGAL_CHARACTERS = r"[\x00-\x08\x0b\x0c\x0e-\x1f]"
+
+
+def export_path(job_id, export_format):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return os.path.join(EXPORT_DIR, job_id + EXPORT_FORMATS[export_format][0])
+
+
+def download_name(subreddit, export_format):
+    """
+    File name offered to the browser, matching the synchronous export_data names.
+    """
+    return (subreddit or "reddit_export") + EXPORT_FORMATS[export_format][0]
+
+
+def write_export(reader, export_format, fh, on_batch=None, timezone_name=None):
+    """
+    Write every record batch from `reader` to the binary file `fh` in `export_format`,
+    one batch at a time. `on_batch(rows_written)` is called after each batch.
+    `timezone_name` only applies to Excel. Returns the number of rows written.
+    """
+    if export_format == "excel":
+        return _write_excel(reader, fh, on_batch or (lambda rows: None), timezone_name)
+
+    rows = 0
+
+    def counted(written):
+        nonlocal rows
+        rows = written
+        if on_batch:
+            on_batch(written)
+
+    for chunk in iter_export_chunks(reader, export_format, on_batch=counted):
+        fh.write(chunk)
+    return rows
+
+
+def iter_export_chunks(reader, export_format, on_batch=None, write_options=None):
+    """
+    Encode record batches from `reader` as byte chunks of `export_format`, one chunk
+    per batch, so only a single batch is ever held in memory. Used both for chunked
+    HTTP responses and for export files. Excel is not a streamable format.
+    """
+    encoders = {
+        "csv": iter_csv_chunks,
+        "json": iter_json_chunks,
+        "ndjson": iter_ndjson_chunks,
+    }
+    if export_format == "arrow":
+        return iter_arrow_chunks(reader, write_options, on_batch)
+    return encoders[export_format](reader, on_batch)
+
+
+def _drain(sink):
+    """
+    Return everything written to a BytesIO sink so far and reset it.
+    """
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _json_rows(batch):
+    return [json.dumps(record, default=_json_default, ensure_ascii=False) for record in batch.to_pylist()]
+
+
+def iter_arrow_chunks(reader, write_options=None, on_batch=None):
+    rows = 0
+    sink = io.BytesIO()
+    with ipc.new_stream(sink, reader.schema, options=write_options) as writer:
+        yield _drain(sink)
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            if on_batch:
+                on_batch(rows)
+            yield _drain(sink)
+    yield _drain(sink)
+
+
+def iter_csv_chunks(reader, on_batch=None):
+    # Same bytes as the old DataFrame.to_csv(index=False) export: minimal quoting and
+    # created_utc as "%Y-%m-%d %H:%M:%S". Rows are built column-wise with Arrow
+    # compute, so no per-row Python objects are created.
+    rows = 0
+    yield _csv_line(reader.schema.names)
+    for batch in reader:
+        if batch.num_rows:
+            lines = pc.binary_join_element_wise(*[_csv_field(column) for column in batch.columns], ",")
+            lines = pa.ListArray.from_arrays([0, len(lines)], pc.binary_join_element_wise(lines, "", "\n"))
+            yield pc.binary_join(lines, "")[0].as_buffer().to_pybytes()
+        rows += batch.num_rows
+        if on_batch:
+            on_batch(rows)
+
+
+def _csv_line(values):
+    sink = io.StringIO()
+    csv.writer(sink, lineterminator="\n").writerow(values)
+    return sink.getvalue().encode("utf-8")
+
+
+def _csv_field(column):
+    """
+    Render one column as CSV fields the way pandas did: empty for nulls, True/False
+    for booleans, whole seconds for timestamps, and strings quoted only when they
+    contain a delimiter, quote or line break. Timestamps are written in UTC.
+    """
+    if pa.types.is_dictionary(column.type):
+        column = column.dictionary_decode()
+    if pa.types.is_timestamp(column.type):
+        column = pc.strftime(column.cast(pa.timestamp("s"), safe=False), "%Y-%m-%d %H:%M:%S")
+    elif pa.types.is_boolean(column.type):
+        column = pc.if_else(column, "True", "False")
+    elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        quoted = pc.binary_join_element_wise('"', pc.replace_substring(column, '"', '""'), '"', "")
+        column = pc.if_else(pc.match_substring_regex(column, '[,"\r\n]'), quoted, column)
+    else:
+        column = column.cast(pa.string())
+    return pc.fill_null(column.cast(pa.string()), "")
+
+
+def iter_ndjson_chunks(reader, on_batch=None):
+    rows = 0
+    for batch in reader:
+        lines = _json_rows(batch)
+        rows += len(lines)
+        if on_batch:
+            on_batch(rows)
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_json_chunks(reader, on_batch=None):
+    # Same shape as the old export_data response: one JSON array of row objects.
+    rows = 0
+    yield b"["
+    for batch in reader:
+        lines = _json_rows(batch)
+        if lines:
+            yield ((b"," if rows else b"") + ",".join(lines).encode("utf-8"))
+        rows += len(lines)
+        if on_batch:
+            on_batch(rows)
+    yield b"]"
+
+
+def _write_excel(reader, fh, on_batch, timezone_name=None):
+    """
+    Write an .xlsx workbook with openpyxl's write-only mode, which streams rows to
+    disk instead of keeping cell objects. Rolls over to a new sheet whenever one
+    reaches Excel's row limit.
+    """
+    from openpyxl import Workbook
+
+    timezone_name = timezone_name or EXPORT_TIMEZONE
+    workbook = Workbook(write_only=True)
+    header = reader.schema.names
+    sheet = None
+    sheet_rows = EXCEL_MAX_ROWS
+    rows = 0
+    for batch in reader:
+        for record in _excel_rows(batch, timezone_name):
+            if sheet_rows >= EXCEL_MAX_ROWS:
+                sheet = workbook.create_sheet(_sheet_title(len(workbook.worksheets)))
+                sheet.append(header)
+                sheet_rows = 1
+            sheet.append(record)
+            sheet_rows += 1
+        rows += batch.num_rows
+        on_batch(rows)
+    if sheet is None:
+        workbook.create_sheet(_sheet_title(0)).append(header)
+    workbook.save(fh)
+    return rows
+
+
+def _sheet_title(index):
+    return EXCEL_SHEET_TITLE if index == 0 else f"{EXCEL_SHEET_TITLE} {index + 1}"
+
+
+def _excel_rows(batch, timezone_name):
+    """
+    Convert a record batch to row tuples Excel accepts. Timestamps are shifted to
+    `timezone_name` and made naive, and strings are cleaned, column-wide in Arrow.
+    """
+    columns = []
+    for column in batch.columns:
+        if pa.types.is_timestamp(column.type):
+            if column.type.tz is None:
+                # ClickHouse sends UTC wall time.
+                column = column.cast(pa.timestamp(column.type.unit, "UTC"))
+            column = pc.local_timestamp(column.cast(pa.timestamp(column.type.unit, timezone_name)))
+        elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            column = pc.replace_substring_regex(column, EXCEL_ILLEGAL_CHARACTERS, "")
+            column = pc.utf8_slice_codeunits(column, 0, EXCEL_MAX_CELL_CHARS)
+        columns.append(column.to_pylist())
+    return zip(*columns)
+
+
+def valid_timezone(name):
+    """
+    True if `name` is an IANA timezone such as "America/New_York".
+    """
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
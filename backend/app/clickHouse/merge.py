@@ -0,0 +1,163 @@
+import queue
+import threading
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Record batches each table's reader thread may read ahead of the merge.
+PREFETCH_BATCHES = 4
+SORT_KEY = "created_utc"
+
+_DONE = object()
+
+
+class TableQueries:
+    """
+    A multi-table dataset query split into one query per table. Each runs on its own
+    ClickHouse client and their Arrow streams are combined by MergedReader, instead of
+    ClickHouse merge-sorting a UNION ALL before it sends the first row.
+    """
+
+    def __init__(self, queries, columns, ordered=True):
+        self.queries = queries  # [(sql, parameters)], one per table
+        self.columns = columns
+        self.ordered = ordered
+
+
+def unified_schema(schemas, columns):
+    """
+    Schema every table's batches are cast to. Columns whose types differ between
+    tables (LowCardinality in one, plain String in the other) are decoded to plain values.
+    """
+    fields = []
+    for name in columns:
+        types = [schema.field(name).type for schema in schemas]
+        target = types[0]
+        if any(other != target for other in types):
+            target = next((t for t in types if not pa.types.is_dictionary(t)), target)
+            if pa.types.is_dictionary(target):
+                target = target.value_type
+        fields.append(pa.field(name, target))
+    return pa.schema(fields)
+
+
+class MergedReader:
+    """
+    Reader over several Arrow stream readers, each already sorted by created_utc DESC,
+    that yields one stream in created_utc DESC order (or, unordered, batches in the
+    order they arrive). Each input is read on its own thread so the tables download
+    and decode in parallel. `on_close` callbacks run after the threads are told to stop;
+    `drained` tells them whether every input was read to the end.
+    """
+
+    def __init__(self, readers, columns, ordered=True, on_close=()):
+        self._readers = readers
+        self._columns = list(columns)
+        self._work_columns = self._columns + ([SORT_KEY] if ordered and SORT_KEY not in self._columns else [])
+        self._work_schema = unified_schema([r.schema for r in readers], self._work_columns)
+        self.schema = pa.schema([self._work_schema.field(name) for name in self._columns])
+        self._ordered = ordered
+        self._on_close = list(on_close)
+        self._stop = threading.Event()
+        self._threads = []
+        self.drained = False
+
+    def __iter__(self):
+        yield from self._merge() if self._ordered else self._interleave()
+        self.drained = True
+
+    def close(self):
+        self._stop.set()
+        for callback in self._on_close:
+            callback()
+
+    def _start(self, reader, out, tag):
+        def run():
+            try:
+                for batch in reader:
+                    if not self._put(out, (tag, batch)):
+                        return
+                self._put(out, (tag, _DONE))
+            except Exception as e:
+                self._put(out, (tag, e))
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _put(self, out, item):
+        while not self._stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _conform(self, table):
+        return table.select(self._work_columns).cast(self._work_schema)
+
+    def _output(self, table):
+        return table.select(self._columns).to_batches()
+
+    def _interleave(self):
+        out = queue.Queue(maxsize=PREFETCH_BATCHES * len(self._readers))
+        for tag, reader in enumerate(self._readers):
+            self._start(reader, out, tag)
+        remaining = len(self._readers)
+        while remaining:
+            _, item = out.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield from self._output(self._conform(pa.Table.from_batches([item])))
+
+    def _merge(self):
+        """
+        Two-way (or k-way) merge on whole batches: every buffered row at or above the
+        highest "last key" among the inputs can be emitted, because no input can still
+        produce a row above it. Those rows are sorted together and sent as one batch.
+        """
+        queues = [queue.Queue(maxsize=PREFETCH_BATCHES) for _ in self._readers]
+        for tag, reader in enumerate(self._readers):
+            self._start(reader, queues[tag], tag)
+
+        def next_table(i):
+            while True:
+                _, item = queues[i].get()
+                if item is _DONE:
+                    return None
+                if isinstance(item, Exception):
+                    raise item
+                if item.num_rows:
+                    return self._conform(pa.Table.from_batches([item]))
+
+        buffers = {i: None for i in range(len(self._readers))}
+        while True:
+            for i in list(buffers):
+                if buffers[i] is None or buffers[i].num_rows == 0:
+                    buffers[i] = next_table(i)
+                    if buffers[i] is None:
+                        del buffers[i]
+            if not buffers:
+                return
+            if len(buffers) == 1:
+                (i, table), = buffers.items()
+                yield from self._output(table)
+                while (table := next_table(i)) is not None:
+                    yield from self._output(table)
+                return
+
+            keys = {i: pc.cast(table.column(SORT_KEY), pa.int64()) for i, table in buffers.items()}
+            threshold = max(key[-1].as_py() for key in keys.values())
+            parts = []
+            for i, table in buffers.items():
+                # Each buffer is sorted descending, so the rows to emit are a prefix.
+                take = pc.sum(pc.greater_equal(keys[i], threshold)).as_py() or 0
+                parts.append(table.slice(0, take))
+                buffers[i] = table.slice(take)
+            merged = pa.concat_tables(parts)
+            merged = merged.take(pc.sort_indices(merged, sort_keys=[(SORT_KEY, "descending")]))
+            yield from self._output(merged)
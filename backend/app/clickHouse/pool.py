@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+# Upper bound on clickhouse_connect clients per gunicorn worker; they are opened lazily.
+CH_POOL_MAX_SIZE = int(os.getenv("CH_POOL_MAX_SIZE", 25))
+# Seconds a request waits for a free client before failing with 503.
+CH_POOL_TIMEOUT = float(os.getenv("CH_POOL_TIMEOUT", 5))
+# Clients idle for longer than this are pinged on checkout (0 pings every time).
+CH_POOL_VALIDATE_AFTER = float(os.getenv("CH_POOL_VALIDATE_AFTER", 30))
+
+# Extra ClickHouse settings per endpoint, e.g.
+# CH_ENDPOINT_SETTINGS='{"search_list": {"max_execution_time": 2}, "export_data": {"max_execution_time": 3600}}'
+ENDPOINT_SETTINGS = json.loads(os.getenv("CH_ENDPOINT_SETTINGS", "{}") or "{}")
+
+
+class PoolExhaustedError(Exception):
+    """
+    No client became free within the pool timeout.
+    """
+
+
+class ClickHousePool:
+    """
+    Thread-safe pool that opens clients on demand up to `max_size`, pings clients
+    that have been idle before handing them out, and drops clients that fail.
+    """
+
+    def __init__(self, factory, max_size=CH_POOL_MAX_SIZE, timeout=CH_POOL_TIMEOUT,
+                 validate_after=CH_POOL_VALIDATE_AFTER):
+        self._factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self._idle = deque()  # (client, released_at)
+        self._open = 0
+        self._cond = threading.Condition()
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "exhausted": 0,
+            "created": 0,
+            "create_failures": 0,
+            "discarded": 0,
+        }
+
+    def get(self, timeout=None):
+        """
+        Check out a healthy client, waiting up to `timeout` seconds for one to be
+        released. Raises PoolExhaustedError if none frees up in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        waited = False
+        while True:
+            client, released_at = None, None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        client, released_at = self._idle.pop()
+                        break
+                    if self._open < self.max_size:
+                        self._open += 1
+                        break
+                    remaining = timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self._counters["exhausted"] += 1
+                        raise PoolExhaustedError(
+                            f"No ClickHouse connections are available after {timeout:g}s "
+                            f"({self.max_size} in use)."
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if client is None:
+                client = self._create()
+            elif time.monotonic() - released_at >= self.validate_after and not self._healthy(client):
+                self._discard(client)
+                continue
+
+            wait = time.monotonic() - start
+            with self._cond:
+                self._counters["checkouts"] += 1
+                self._counters["waits"] += int(waited)
+                self._counters["wait_seconds_total"] += wait
+                self._counters["wait_seconds_max"] = max(self._counters["wait_seconds_max"], wait)
+            return client
+
+    def release(self, client, broken=False):
+        """
+        Return a client to the pool, or close it if the caller saw it fail.
+        """
+        if broken:
+            self._discard(client)
+            return
+        with self._cond:
+            self._idle.append((client, time.monotonic()))
+            self._cond.notify()
+
+    def _create(self):
+        try:
+            client = self._factory()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._counters["create_failures"] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters["created"] += 1
+        return client
+
+    @staticmethod
+    def _healthy(client):
+        try:
+            return bool(client.ping())
+        except Exception:
+            return False
+
+    def _discard(self, client):
+        try:
+            client.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._counters["discarded"] += 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "timeout": self.timeout,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                **self._counters
+            }
+
+
+def endpoint_settings(endpoint):
+    """
+    ClickHouse settings configured for a Flask endpoint ("clickHouse_BP.get_arrow"
+    and "get_arrow" both match).
+    """
+    name = (endpoint or "").rsplit(".", 1)[-1]
+    return dict(ENDPOINT_SETTINGS.get(name, {}))
@@ -1,30 +1,52 @@
-from flask import jsonify, request, Response
+from flask import jsonify, request, Response, send_file
 from clickhouse_connect import get_client
 from dotenv import load_dotenv
+import pyarrow as pa
 import pyarrow.ipc as ipc
-from queue import Queue
 import os
 import json
+import re
+import base64
 import socket
+from common import query_builder
 from . import clickHouse_BP
+from . import arrow_cache
+from . import export_writers
+from . import subreddit_index
+from . import pool
+from . import admission
+from . import merge
+from . import estimate
 from ..rpc_client import TopicModelRpcClient  # Import the RPC client modules
 from ..rpc_client import SentimentAnalysisRpcClient 
+from ..rpc_client import ExportRpcClient
 from app.extensions import db
 import uuid
 
 import io
-import pandas as pd
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-from io import BytesIO
 import time
 
 import app.redis_client as redis
+from app import metrics
 
 load_dotenv()
 
-#Currently set to 25, increase later if needed.
-POOL_SIZE = 25
-connection_pool = Queue(maxsize=POOL_SIZE)
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Upper bound for ?page_size= so a single page stays cheap to buffer.
+MAX_PAGE_SIZE = int(os.getenv("ARROW_MAX_PAGE_SIZE", 100000))
+CURSOR_ID_PATTERN = re.compile(r"^[A-Za-z0-9_]{1,64}$")
+
+# IPC buffer compression a client can ask for with ?compression= or X-Arrow-Compression.
+# The browser's Arrow JS reader cannot decompress buffers, so the default stays "none".
+ARROW_COMPRESSION_CODECS = {"none": None, "lz4": "lz4", "zstd": "zstd"}
+
+# Stream the combined submissions+comments option as one query per table, merged here
+# by created_utc, rather than a UNION ALL that ClickHouse sorts before the first byte.
+SPLIT_TABLE_QUERIES = os.getenv("SPLIT_TABLE_QUERIES", "true").lower() == "true"
 
 def get_new_client():
     return get_client(
@@ -36,20 +58,25 @@ def get_new_client():
     )
 
 
-for _ in range(POOL_SIZE):
-    connection_pool.put(get_new_client())
+# Clients are opened on first use (up to CH_POOL_MAX_SIZE per worker) and pinged
+# on checkout when they have been idle; see pool.py for the knobs.
+connection_pool = pool.ClickHousePool(get_new_client)
 
 
 def get_pooled_client():
+    start_time = time.monotonic()
     try:
-        return connection_pool.get(timeout=5)  
-    except:
-        raise Exception("No ClickHouse connections are available.")
+        return connection_pool.get()
+    except pool.PoolExhaustedError:
+        metrics.CH_POOL_EXHAUSTED.inc()
+        raise
+    finally:
+        metrics.CH_POOL_WAIT_SECONDS.observe(time.monotonic() - start_time)
 
 
-def release_client(client):
+def release_client(client, broken=False):
     if client:
-        connection_pool.put(client)
+        connection_pool.release(client, broken)
 
 
 def _request_client_id():
@@ -62,6 +89,413 @@ def _request_client_id():
     return os.getenv("CLIENT_ID") or socket.gethostname()
 
 
+def _admission_client_id():
+    """
+    Identity heavy-query slots are counted against. Requests without a client ID fall
+    back to the caller's address (nginx passes it as X-Real-IP) rather than sharing
+    the process-wide fallback; job ownership keeps using _request_client_id().
+    """
+    client_id = (request.headers.get("X-Client-ID") or request.args.get("client_id") or "").strip()
+    if client_id:
+        return client_id
+    return request.headers.get("X-Real-IP") or request.remote_addr or "unknown"
+
+
+def _encode_cursor(created_utc_ms, row_id):
+    """
+    Opaque keyset cursor for the row that ended a page.
+    """
+    payload = json.dumps([int(created_utc_ms), str(row_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(value):
+    """
+    Decode a cursor produced by _encode_cursor. Returns (created_utc_ms, id) or None.
+    """
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        created_utc_ms, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_utc_ms = int(created_utc_ms)
+    except Exception:
+        return None
+    if not isinstance(row_id, str) or not CURSOR_ID_PATTERN.match(row_id):
+        return None
+    return created_utc_ms, row_id
+
+
+def _arrow_page_response(client, query, parameters, settings, columns, page_size, codec="none"):
+    """
+    Run one keyset page and return it as an Arrow stream. The page is bounded by
+    page_size, so it is buffered in order to put the next cursor in a header.
+    """
+    start_time = time.time()
+    table = client.query_arrow(query, parameters=parameters, settings=settings, use_strings=True)
+    query_arrow_time = time.time() - start_time
+    print(f"Query Arrow page time: {query_arrow_time:.4f} seconds", flush=True)
+    metrics.observe_query(request.endpoint, query_arrow_time, table.num_rows)
+
+    headers = {"Content-Disposition": "attachment; filename=data.arrow", "X-Arrow-Compression": codec}
+    if table.num_rows == page_size:
+        last_created = table.column("created_utc").cast(pa.int64())[-1].as_py()
+        last_id = table.column(query_builder.KEYSET_ID_COLUMN)[-1].as_py()
+        headers["X-Next-Cursor"] = _encode_cursor(last_created, last_id)
+
+    start_time = time.time()
+    table = table.select(columns)
+    stream = io.BytesIO()
+    with ipc.new_stream(stream, table.schema, options=_arrow_write_options(codec)) as writer:
+        writer.write_table(table)
+    metrics.observe_serialization(request.endpoint, time.time() - start_time)
+    return Response(stream.getvalue(), mimetype=ARROW_MIMETYPE, headers=headers)
+
+
+def _arg_flag(name, default=False):
+    """
+    Read a boolean query parameter such as ?stream=false.
+    """
+    value = request.args.get(name)
+    if value is None or value.strip() == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _open_arrow_reader(client, query, parameters=None, settings=None):
+    """
+    Start an ArrowStream query and return the raw HTTP stream and a reader over it.
+    The reader yields record batches as ClickHouse sends each block. A
+    merge.TableQueries is opened with _open_table_readers.
+    """
+    if isinstance(query, merge.TableQueries):
+        return _open_table_readers(client, query, settings)
+    raw = client.raw_stream(
+        query,
+        parameters=parameters,
+        settings={**(settings or {}), "output_format_arrow_string_as_string": 1},
+        fmt="ArrowStream"
+    )
+    try:
+        return raw, ipc.open_stream(raw)
+    except Exception:
+        raw.close()
+        raise
+
+
+def _open_table_readers(client, table_queries, settings=None):
+    """
+    Start one ArrowStream per table at the same time, the first on `client` and the
+    others on extra pooled clients, and merge them. The merged reader is returned in
+    place of the raw stream too: closing it closes every stream and releases the
+    extra clients, as broken unless every stream was read to the end.
+    """
+    clients = [client]
+    try:
+        for _ in table_queries.queries[1:]:
+            clients.append(get_pooled_client())
+    except Exception:
+        for extra in clients[1:]:
+            release_client(extra, broken=True)
+        raise
+
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        futures = [
+            executor.submit(_open_arrow_reader, table_client, sql, parameters, settings)
+            for table_client, (sql, parameters) in zip(clients, table_queries.queries)
+        ]
+    opened, error = [], None
+    for future in futures:
+        try:
+            opened.append(future.result())
+        except Exception as e:
+            error = error or e
+
+    def close_streams():
+        for raw, _ in opened:
+            raw.close()
+        for extra in clients[1:]:
+            release_client(extra, broken=reader is None or not reader.drained)
+
+    reader = None
+    if error:
+        close_streams()
+        raise error
+    reader = merge.MergedReader(
+        [reader for _, reader in opened],
+        table_queries.columns,
+        ordered=table_queries.ordered,
+        on_close=[close_streams]
+    )
+    return reader, reader
+
+
+def _table_queries(tables, columns, filters, ordered=True):
+    """
+    Split a multi-table dataset query for _open_table_readers, or return None when
+    it has to stay a single query (one table, or a row-count sample).
+    """
+    sample = filters.get("sample")
+    if not SPLIT_TABLE_QUERIES or len(tables) < 2 or (sample and sample[0] == "rows"):
+        return None
+    queries = query_builder.build_table_queries(tables, columns, ordered=ordered, **filters)
+    return merge.TableQueries(queries, columns, ordered)
+
+
+def _stream_arrow_response(client, query, parameters=None, settings=None, filename="data.arrow",
+                           cache_key=None, codec="none", spill_path=None, ticket=None):
+    """
+    Build a chunked Arrow IPC response for `query`. The client and admission ticket
+    are released and the ClickHouse stream closed once the response has been sent
+    (or abandoned, in which case the client is discarded as broken).
+    With a cache_key the stream is also written to the Arrow result cache, and with
+    a spill_path from arrow_cache.lead() it is shared with concurrent followers.
+    """
+    start_time = time.time()
+    try:
+        raw, reader = _open_arrow_reader(client, query, parameters, settings)
+    except Exception:
+        release_client(client, broken=True)
+        admission.release(ticket)
+        if spill_path:
+            arrow_cache.abandon(cache_key, spill_path)
+        raise
+    open_time = time.time() - start_time
+    print(f"Arrow stream open time: {open_time:.4f} seconds", flush=True)
+    # The generator runs after the view returns, outside the request context.
+    endpoint = request.endpoint
+    metrics.CH_QUERY_SECONDS.labels(endpoint).observe(open_time)
+    rows = [0]
+    finished = [False]
+
+    def count(written):
+        rows[0] = written
+
+    def generate():
+        chunks = export_writers.iter_arrow_chunks(reader, _arrow_write_options(codec), on_batch=count)
+        if cache_key:
+            chunks = arrow_cache.tee(cache_key, chunks, spill_path)
+        for chunk in chunks:
+            yield chunk
+        finished[0] = True
+        print(f"Total Arrow streaming time: {time.time() - start_time:.4f} seconds", flush=True)
+
+    def close():
+        raw.close()
+        # A stream that failed or was cut off leaves the connection mid-response.
+        release_client(client, broken=not finished[0])
+        admission.release(ticket)
+        metrics.CH_ROWS.labels(endpoint).observe(rows[0])
+        if spill_path:
+            # Covers responses closed before the body started; no-op after tee() ran.
+            arrow_cache.abandon(cache_key, spill_path)
+
+    response = Response(
+        generate(),
+        mimetype=ARROW_MIMETYPE,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            # Let nginx pass batches through instead of buffering the whole body.
+            "X-Accel-Buffering": "no",
+            "X-Cache": "MISS" if cache_key else "BYPASS",
+            "X-Arrow-Compression": codec
+        }
+    )
+    response.call_on_close(close)
+    return response
+
+
+def _stream_export_response(client, query, parameters, settings, export_format, filename=None, ticket=None):
+    """
+    Chunked CSV/JSON/NDJSON response encoded batch by batch from ClickHouse's Arrow
+    stream, so memory stays flat whatever the row count. Releases the client and
+    admission ticket on close (the client as broken if the body was not sent in
+    full); without a filename the body is served inline.
+    """
+    start_time = time.time()
+    try:
+        raw, reader = _open_arrow_reader(client, query, parameters, settings)
+    except Exception:
+        release_client(client, broken=True)
+        admission.release(ticket)
+        raise
+    endpoint = request.endpoint
+    metrics.CH_QUERY_SECONDS.labels(endpoint).observe(time.time() - start_time)
+    rows = [0]
+    finished = [False]
+
+    def count(written):
+        rows[0] = written
+
+    def generate():
+        yield from export_writers.iter_export_chunks(reader, export_format, on_batch=count)
+        finished[0] = True
+
+    def close():
+        raw.close()
+        release_client(client, broken=not finished[0])
+        admission.release(ticket)
+        metrics.CH_ROWS.labels(endpoint).observe(rows[0])
+
+    headers = {"X-Accel-Buffering": "no"}
+    if filename:
+        headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response = Response(
+        generate(),
+        mimetype=export_writers.EXPORT_FORMATS[export_format][1],
+        headers=headers
+    )
+    response.call_on_close(close)
+    return response
+
+
+def _follow_arrow_flight(cache_key):
+    """
+    Chunks of an identical query another worker is running, or None.
+    """
+    if not cache_key:
+        return None
+    try:
+        return arrow_cache.follow(cache_key)
+    except Exception as e:
+        print(f"Arrow single-flight unavailable: {e}", flush=True)
+        return None
+
+
+def _excel_export_response(client, query, parameters, settings, subreddit, timezone_name):
+    """
+    Write the export to a temporary .xlsx on disk one record batch at a time, then
+    send it with send_file. The file is removed once the response is closed.
+    """
+    os.makedirs(export_writers.EXPORT_DIR, exist_ok=True)
+    fh = tempfile.NamedTemporaryFile(dir=export_writers.EXPORT_DIR, suffix=".xlsx.tmp", delete=False)
+    broken = False
+    try:
+        raw, reader = _open_arrow_reader(client, query, parameters, settings)
+        try:
+            with fh:
+                export_writers.write_export(reader, 'excel', fh, timezone_name=timezone_name)
+        finally:
+            raw.close()
+    except Exception:
+        broken = True
+        os.remove(fh.name)
+        raise
+    finally:
+        release_client(client, broken)
+
+    response = send_file(
+        fh.name,
+        mimetype=export_writers.EXPORT_FORMATS['excel'][1],
+        as_attachment=True,
+        download_name=export_writers.download_name(subreddit, 'excel')
+    )
+    response.call_on_close(lambda: os.remove(fh.name))
+    return response
+
+
+def _coalesced_arrow_response(chunks, filename="data.arrow", codec="none"):
+    """
+    Stream another worker's in-flight result for the same query (see arrow_cache.follow).
+    """
+    return Response(
+        chunks,
+        mimetype=ARROW_MIMETYPE,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Accel-Buffering": "no",
+            "X-Cache": "COALESCED",
+            "X-Arrow-Compression": codec
+        }
+    )
+
+
+def _cached_arrow_response(path, filename="data.arrow", codec="none"):
+    """
+    Serve a cached Arrow IPC stream straight from disk. send_file hands the open file
+    to gunicorn's file wrapper, which uses sendfile() so the bytes go from the page
+    cache to the socket without being copied through Python.
+    """
+    response = send_file(
+        path,
+        mimetype=ARROW_MIMETYPE,
+        as_attachment=True,
+        download_name=filename,
+        conditional=False,
+        etag=False
+    )
+    response.headers["X-Cache"] = "HIT"
+    response.headers["X-Arrow-Compression"] = codec
+    return response
+
+
+def _with_headers(response, headers):
+    response.headers.update(headers)
+    return response
+
+
+def _arrow_codec():
+    """
+    IPC compression negotiated with ?compression= or the X-Arrow-Compression header.
+    Returns None for an unsupported codec.
+    """
+    codec = (request.args.get('compression') or request.headers.get('X-Arrow-Compression') or 'none')
+    codec = codec.strip().lower()
+    return codec if codec in ARROW_COMPRESSION_CODECS else None
+
+
+def _arrow_write_options(codec):
+    return ipc.IpcWriteOptions(compression=ARROW_COMPRESSION_CODECS[codec])
+
+
+def _arrow_settings():
+    """
+    ClickHouse settings for Arrow responses. LowCardinality columns (subreddit, author,
+    comment parent ids) stay dictionary-encoded unless ?dictionary=false.
+    """
+    if not _arg_flag('dictionary', True):
+        return {}
+    return {"output_format_arrow_low_cardinality_as_dictionary": 1}
+
+
+def _query_settings(settings=None):
+    """
+    Settings for a query issued by the current endpoint: the endpoint's configured
+    settings (CH_ENDPOINT_SETTINGS), then the query cache opt-in, then `settings`.
+    """
+    return {
+        **pool.endpoint_settings(request.endpoint),
+        **_query_cache_settings(),
+        **(settings or {})
+    }
+
+
+def _error_response(e):
+    """
+    JSON error for an unhandled exception; pool exhaustion is a retryable 503 and
+    a rejected heavy query a retryable 429.
+    """
+    if isinstance(e, admission.AdmissionRejectedError):
+        print(f"Admission rejected on {request.endpoint} for {_admission_client_id()}: {e}", flush=True)
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+    if isinstance(e, pool.PoolExhaustedError):
+        print(f"ClickHouse pool exhausted on {request.endpoint}: {connection_pool.stats()}", flush=True)
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = str(max(1, int(connection_pool.timeout)))
+        return response, 503
+    return jsonify({"error": str(e)}), 500
+
+
+def _query_cache_settings():
+    """
+    Opt in to ClickHouse's query cache with ?query_cache=true, optionally with
+    ?query_cache_ttl=<seconds>.
+    """
+    if not _arg_flag('query_cache', False):
+        return {}
+    return query_builder.query_cache_settings(request.args.get('query_cache_ttl', None, type=int))
+
+
 def _is_authorized_for_job(job_id: str):
     owner = redis.get_job_owner(job_id)
     if not owner:
@@ -69,42 +503,80 @@ def _is_authorized_for_job(job_id: str):
     return owner == _request_client_id()
 
 
+def _load_subreddit_rows():
+    """
+    (subreddit, activity) rows for the autocomplete index. Falls back to unranked
+    names when the daily volume table has not been created yet.
+    """
+    client = get_pooled_client()
+    broken = False
+    try:
+        try:
+            return client.query(subreddit_index.RANKED_SUBREDDITS_QUERY).result_rows
+        except Exception as e:
+            print(f"Ranking subreddits by volume failed, loading names only: {e}", flush=True)
+            return client.query(subreddit_index.SUBREDDITS_QUERY).result_rows
+    except Exception:
+        broken = True
+        raise
+    finally:
+        release_client(client, broken)
+
+
+subreddit_search_index = subreddit_index.SubredditIndex(_load_subreddit_rows)
+
+
 @clickHouse_BP.route('/api/search_list', methods=['GET'])
 def search_list():
     prefix = request.args.get('subreddit', '').strip()
     if not prefix:
         return jsonify([])
 
+    # Served from the in-process index once it has loaded; the first requests in a
+    # new worker fall through to ClickHouse while it builds.
+    subreddit_search_index.start()
+    suggestions = subreddit_search_index.suggest(prefix)
+    if suggestions is not None:
+        return jsonify(suggestions)
+
     # Case-insensitive matching
     lower_prefix = prefix.lower()
 
     client = None
+    broken = False
     try:
         client = get_pooled_client()
         # Query the dedicated `subreddits` table with case-insensitive prefix match
         sql = (
             "SELECT subreddit "
             "FROM subreddits "
-            f"WHERE lower(subreddit) LIKE '{lower_prefix}%' "
+            "WHERE lower(subreddit) LIKE {prefix:String} "
             "ORDER BY subreddit ASC "
             "LIMIT 10"
         )
-        qr = client.query(sql)
+        qr = client.query(
+            sql,
+            parameters={"prefix": query_builder.escape_like(lower_prefix) + "%"},
+            settings=_query_settings()
+        )
         # Extract rows from QueryResult
         rows = getattr(qr, 'result_set', None) or getattr(qr, 'rows', None) or qr
         suggestions = [row[0] for row in rows]
         return jsonify(suggestions)
     except Exception:
         # If table doesn't exist or any error, return empty list
+        broken = True
         return jsonify([])
     finally:
         if client:
-            release_client(client)
+            release_client(client, broken)
 
 
 @clickHouse_BP.route("/api/get_arrow", methods=["GET"])
 def get_arrow():
     client = None
+    ticket = None
+    broken = False
     try:
         # Retrieve query parameters.
         subreddit = request.args.get('subreddit', '')
@@ -113,76 +585,240 @@ def get_arrow():
         end_date = request.args.get('endDate', None)
         option = request.args.get('option', 'reddit_comments')  # Default to comments if not specified
         search_value = request.args.get('search_value', '', type=str)
+        search_mode = request.args.get('search_mode', 'substring', type=str)
 
         if not option or option.strip() == '':
             return jsonify({"error": "Data option was not selected."}), 400
 
-        if ',' in option:
-            # If both options are selected, use a UNION ALL query.
-            base_query = (
-                "SELECT * FROM ("
-                "    (SELECT subreddit, author, title, selftext, created_utc, id FROM reddit_submissions) "
-                "    UNION ALL "
-                "    (SELECT subreddit, author, '(Comment)' AS title, body AS selftext, created_utc, parent_id AS id FROM reddit_comments)"
-                ") AS combined"
+        if search_mode not in query_builder.SEARCH_MODES:
+            return jsonify({"error": f"search_mode must be one of {', '.join(query_builder.SEARCH_MODES)}."}), 400
+
+        codec = _arrow_codec()
+        if codec is None:
+            return jsonify({"error": f"compression must be one of {', '.join(ARROW_COMPRESSION_CODECS)}."}), 400
+
+        tables = query_builder.option_tables(option)
+        if not tables:
+            return jsonify({"error": "Invalid option provided."}), 400
+
+        columns = query_builder.parse_columns(request.args.get('columns', ''))
+        if columns is None:
+            return jsonify({"error": f"columns must be a subset of {', '.join(query_builder.DEFAULT_COLUMNS)}."}), 400
+
+        page_size = request.args.get('page_size', None, type=int)
+        if page_size is not None and not 0 < page_size <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"page_size must be between 1 and {MAX_PAGE_SIZE}."}), 400
+
+        cursor = None
+        if request.args.get('cursor'):
+            cursor = _decode_cursor(request.args.get('cursor'))
+            if cursor is None:
+                return jsonify({"error": "Invalid cursor."}), 400
+
+        try:
+            sample = query_builder.parse_sample(request.args.get('sample'))
+            sample_seed = request.args.get('sample_seed', query_builder.DEFAULT_SAMPLE_SEED, type=int)
+        except ValueError:
+            return jsonify({"error": "sample must be a row count or a fraction between 0 and 1."}), 400
+        if sample and sample_seed < 0:
+            return jsonify({"error": "sample_seed must be a non-negative integer."}), 400
+        if sample and sample[0] == "rows" and page_size is not None:
+            return jsonify({"error": "A row-count sample cannot be combined with page_size."}), 400
+
+        # ?clean=true returns the text cleaned at ingestion and skips rows under 25 characters.
+        clean = _arg_flag('clean')
+
+        # Paging needs created_utc even when the caller did not ask for it (the builder
+        # adds the row id itself); both are dropped again before the page is serialized.
+        select_columns = list(columns)
+        if page_size is not None and "created_utc" not in select_columns:
+            select_columns.append("created_utc")
+
+        filters = dict(
+            subreddit=subreddit,
+            start_date=start_date,
+            end_date=end_date,
+            search_value=search_value,
+            search_mode=search_mode,
+            sample=sample,
+            sample_seed=sample_seed,
+            clean=clean
+        )
+        query, parameters = query_builder.build_dataset_query(
+            tables,
+            select_columns,
+            cursor=cursor,
+            page_size=page_size,
+            **filters
+        )
+        projection = query_builder.projection_settings(subreddit, start_date, end_date)
+        settings = _query_settings({**_arrow_settings(), **projection})
+        # ?ordered=false lets the combined option interleave tables as batches arrive.
+        ordered = _arg_flag('ordered', True)
+
+        headers_key = None
+        if sample and arrow_cache.ARROW_CACHE_ENABLED:
+            # Shared by every page and format of the same sample, unlike cache_key.
+            try:
+                headers_key = arrow_cache.cache_key({
+                    "population": True,
+                    "tables": tables,
+                    "subreddit": subreddit,
+                    "startDate": query_builder.format_date(start_date),
+                    "endDate": query_builder.format_date(end_date),
+                    "search_value": search_value,
+                    "search_mode": search_mode,
+                    "sample": list(sample),
+                    "sample_seed": sample_seed,
+                    "clean": clean or None
+                })
+            except Exception as e:
+                print(f"Arrow cache headers unavailable: {e}", flush=True)
+
+        def sample_headers(count=True):
+            """
+            Sampled responses report how many rows matched before sampling. The count
+            scans the whole unsampled filter, so it runs under an admission ticket and
+            only for the first page; the result is stored so later pages and cache
+            hits reuse it.
+            """
+            nonlocal client, ticket
+            if not sample:
+                return {}
+            headers = {
+                "X-Sample": f"{sample[0]}:{sample[1]}",
+                "X-Sample-Seed": str(sample_seed)
+            }
+            try:
+                cached = arrow_cache.cached_headers(headers_key)
+            except Exception as e:
+                print(f"Arrow cache headers unavailable: {e}", flush=True)
+                cached = None
+            if cached:
+                return cached
+            if not count or cursor is not None:
+                return headers
+            if client is None:
+                client = get_pooled_client()
+            count_query, count_parameters = query_builder.build_count_query(
+                tables,
+                subreddit=subreddit,
+                start_date=start_date,
+                end_date=end_date,
+                search_value=search_value,
+                search_mode=search_mode,
+                clean=clean
             )
-        elif option == "reddit_submissions":
-            base_query = "SELECT subreddit, author, title, selftext, created_utc, id FROM reddit_submissions"
-        elif option == "reddit_comments":
-            base_query = "SELECT subreddit, author, '(Comment)' AS title, body AS selftext, created_utc, parent_id AS id FROM reddit_comments"
-        # Fix to prevent error to console
-
-        conditions = []
-        if subreddit:
-            conditions.append(f"subreddit = '{subreddit}'")
-        if start_date:
-            start_date_formatted = start_date.replace("T", " ").split(".")[0]
-            conditions.append(f"created_utc >= toDateTime64('{start_date_formatted}', 3)")
-        if end_date:
-            end_date_formatted = end_date.replace("T", " ").split(".")[0]
-            conditions.append(f"created_utc <= toDateTime64('{end_date_formatted}', 3)")
-        if search_value:
-            conditions.append(f"selftext LIKE '%{search_value}%'")
-
-        # Add condition to filter out posts by AutoModerator.
-        conditions.append("author != 'AutoModerator'")
-        
-        query = base_query
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        query += " ORDER BY created_utc DESC"
-        query += " LIMIT 9999999999999 OFFSET 0"
-        
-        client = get_pooled_client()
+            if ticket is None:
+                ticket = admission.admit(client, count_query, count_parameters, _admission_client_id(), projection)
+            population = client.query(count_query, parameters=count_parameters, settings=_query_settings(projection))
+            headers["X-Sample-Population"] = str(population.result_rows[0][0])
+            try:
+                arrow_cache.save_headers(headers_key, headers)
+            except Exception as e:
+                print(f"Arrow cache headers unavailable: {e}", flush=True)
+            return headers
+
+        cache_key = None
+        if page_size is None and arrow_cache.ARROW_CACHE_ENABLED:
+            try:
+                cache_key = arrow_cache.cache_key({
+                    "tables": tables,
+                    "columns": columns,
+                    "subreddit": subreddit,
+                    "startDate": query_builder.format_date(start_date),
+                    "endDate": query_builder.format_date(end_date),
+                    "search_value": search_value,
+                    "search_mode": search_mode,
+                    "compression": codec,
+                    "dictionary": bool(settings.get("output_format_arrow_low_cardinality_as_dictionary")),
+                    "sample": list(sample) if sample else None,
+                    "sample_seed": sample_seed if sample else None,
+                    "clean": clean or None,
+                    "ordered": None if ordered else False
+                })
+                cached_path = arrow_cache.lookup(cache_key)
+            except Exception as e:
+                print(f"Arrow cache unavailable: {e}", flush=True)
+                cache_key, cached_path = None, None
+            if cached_path:
+                return _with_headers(_cached_arrow_response(cached_path, codec=codec), sample_headers())
+
+        # An identical query already running in any worker is joined instead of re-run.
+        # Followers never reach ClickHouse, so they skip admission control; the leader
+        # stored the sample headers before it claimed the flight.
+        chunks = _follow_arrow_flight(cache_key)
+        if chunks is not None:
+            return _with_headers(_coalesced_arrow_response(chunks, codec=codec), sample_headers(count=False))
+
+        if client is None:
+            client = get_pooled_client()
         if client is None:
             return jsonify({"error": "Failed to get ClickHouse client."}), 500
 
-        
+        # Pages are bounded by page_size; full results wait for a heavy-query slot.
+        if page_size is None:
+            ticket = admission.admit(client, query, parameters, _admission_client_id(), projection)
+        extra_headers = sample_headers()
+
+        streaming = _arg_flag('stream', True)
+        spill_path = None
+        if cache_key and streaming:
+            try:
+                spill_path = arrow_cache.lead(cache_key)
+                if spill_path is None:
+                    chunks = _follow_arrow_flight(cache_key)
+            except Exception as e:
+                print(f"Arrow single-flight unavailable: {e}", flush=True)
+            if chunks is not None:
+                return _with_headers(_coalesced_arrow_response(chunks, codec=codec), extra_headers)
+
+        if page_size is not None:
+            return _with_headers(
+                _arrow_page_response(client, query, parameters, settings, columns, page_size, codec),
+                extra_headers
+            )
+
+        if streaming:
+            # Forward record batches as ClickHouse produces them; the response
+            # owns the client from here on and releases it when it closes.
+            stream_client, client = client, None
+            stream_ticket, ticket = ticket, None
+            stream_query = _table_queries(tables, columns, filters, ordered) or query
+            return _with_headers(
+                _stream_arrow_response(stream_client, stream_query, parameters, settings, cache_key=cache_key,
+                                       codec=codec, spill_path=spill_path, ticket=stream_ticket),
+                extra_headers
+            )
+
         # Use query_arrow to get an Arrow Table directly.
         start_time = time.time()
-        table = client.query_arrow(query, use_strings=True)
+        table = client.query_arrow(query, parameters=parameters, settings=settings, use_strings=True)
         query_arrow_time = time.time() - start_time
         print(f"Query Arrow time: {query_arrow_time:.4f} seconds", flush=True)
+        metrics.observe_query(request.endpoint, query_arrow_time, table.num_rows)
 
         # Return empty Arrow stream
         if table.num_rows == 0:
             stream = io.BytesIO()
-            with ipc.new_stream(stream, table.schema) as writer:
+            with ipc.new_stream(stream, table.schema, options=_arrow_write_options(codec)) as writer:
                 writer.write_table(table)
             stream.seek(0)
             return Response(
                 stream.getvalue(), 
-                mimetype='application/vnd.apache.arrow.stream',
-                headers={"Content-Disposition": "attachment; filename=data.arrow"}
+                mimetype=ARROW_MIMETYPE,
+                headers={"Content-Disposition": "attachment; filename=data.arrow", "X-Arrow-Compression": codec,
+                         **extra_headers}
             )
         
         # Serialize the Arrow Table into a binary stream.
         start_time = time.time()
         stream = io.BytesIO()
-        with ipc.new_stream(stream, table.schema) as writer:
+        with ipc.new_stream(stream, table.schema, options=_arrow_write_options(codec)) as writer:
             writer.write_table(table)
         serialization_time = time.time() - start_time
         print(f"Arrow serialization time: {serialization_time:.4f} seconds", flush=True)
+        metrics.observe_serialization(request.endpoint, serialization_time)
         
         total_time = query_arrow_time + serialization_time
         print(f"Total Arrow processing time: {total_time:.4f} seconds", flush=True)
@@ -190,16 +826,165 @@ def get_arrow():
         stream.seek(0)
         return Response(
             stream.getvalue(), 
-            mimetype='application/vnd.apache.arrow.stream',
-            headers={"Content-Disposition": "attachment; filename=data.arrow"}
+            mimetype=ARROW_MIMETYPE,
+            headers={"Content-Disposition": "attachment; filename=data.arrow", "X-Arrow-Compression": codec,
+                     **extra_headers}
         )
     
     except Exception as e:
+        broken = True
         print(f"Error in get_arrow: {e}", flush=True)
-        return jsonify({"error": str(e)}), 500
+        return _error_response(e)
     
     finally:
-        release_client(client)
+        release_client(client, broken)
+        admission.release(ticket)
+
+@clickHouse_BP.route("/api/arrow_cache/stats", methods=["GET"])
+def arrow_cache_stats():
+    try:
+        return jsonify(arrow_cache.stats())
+    except Exception as e:
+        return _error_response(e)
+
+
+@clickHouse_BP.route("/api/pool/stats", methods=["GET"])
+def pool_stats():
+    """
+    Connection pool counters for the worker that serves this request.
+    """
+    return jsonify({"pid": os.getpid(), **connection_pool.stats()}), 200
+
+
+@clickHouse_BP.route("/api/admission/stats", methods=["GET"])
+def admission_stats():
+    """
+    Heavy-query limits and the number of slots in use across all workers.
+    """
+    try:
+        return jsonify(admission.stats()), 200
+    except Exception as e:
+        return _error_response(e)
+
+
+@clickHouse_BP.route("/api/arrow_cache/invalidate", methods=["POST"])
+def arrow_cache_invalidate():
+    """
+    Called after ingestion with {"subreddits": [...]}; an empty list clears everything.
+    Requires the CACHE_INVALIDATE_TOKEN shared secret as a bearer token.
+    """
+    if not arrow_cache.invalidation_authorized(request.headers.get("Authorization")):
+        return jsonify({"error": "Unauthorized."}), 401
+    try:
+        request_data = request.get_json(silent=True) or {}
+        subreddits = request_data.get("subreddits", [])
+        if not isinstance(subreddits, list):
+            return jsonify({"error": "subreddits must be an array of strings"}), 400
+        arrow_cache.invalidate([str(s) for s in subreddits if s])
+        return jsonify({"invalidated": subreddits or "all"}), 200
+    except Exception as e:
+        return _error_response(e)
+
+
+@clickHouse_BP.route("/api/estimate", methods=["GET"])
+def estimate_dataset():
+    """
+    Estimated rows, compressed/uncompressed bytes and topic job duration for the same
+    parameters as get_arrow, from EXPLAIN ESTIMATE and system.parts instead of a count.
+    """
+    client = None
+    broken = False
+    try:
+        option = request.args.get('option', 'reddit_comments')
+        search_mode = request.args.get('search_mode', 'substring', type=str)
+        if search_mode not in query_builder.SEARCH_MODES:
+            return jsonify({"error": f"search_mode must be one of {', '.join(query_builder.SEARCH_MODES)}."}), 400
+
+        tables = query_builder.option_tables(option)
+        if not tables:
+            return jsonify({"error": "Invalid option provided."}), 400
+
+        try:
+            sample = query_builder.parse_sample(request.args.get('sample'))
+        except ValueError:
+            return jsonify({"error": "sample must be a row count or a fraction between 0 and 1."}), 400
+
+        subreddit = request.args.get('subreddit', '')
+        start_date = request.args.get('startDate', None)
+        end_date = request.args.get('endDate', None)
+        # Sampling is applied to the estimate afterwards; it does not change what is read.
+        query, parameters = query_builder.build_dataset_query(
+            tables,
+            query_builder.DEFAULT_COLUMNS,
+            subreddit=subreddit,
+            start_date=start_date,
+            end_date=end_date,
+            search_value=request.args.get('search_value', '', type=str),
+            search_mode=search_mode,
+            clean=_arg_flag('clean')
+        )
+        client = get_pooled_client()
+        result = estimate.estimate_dataset(
+            client, query, parameters, tables, sample,
+            _query_settings(query_builder.projection_settings(subreddit, start_date, end_date))
+        )
+        result["heavy"] = result["rows"] > admission.ADMISSION_HEAVY_ROWS
+        return jsonify(result), 200
+    except Exception as e:
+        broken = True
+        return _error_response(e)
+    finally:
+        release_client(client, broken)
+
+
+@clickHouse_BP.route("/api/volume", methods=["GET"])
+def volume():
+    """
+    Binned posting volume for a subreddit between `start` and `end` (epoch milliseconds),
+    read from the pre-aggregated reddit_daily_volume table instead of the raw rows.
+    """
+    client = None
+    broken = False
+    try:
+        subreddit = request.args.get('subreddit', '', type=str)
+        option = request.args.get('option', 'reddit_submissions,reddit_comments')
+        bin_size = request.args.get('bin', 'day', type=str)
+        start_ms = request.args.get('start', None, type=int)
+        end_ms = request.args.get('end', None, type=int)
+
+        tables = query_builder.option_tables(option)
+        if not tables:
+            return jsonify({"error": "Invalid option provided."}), 400
+        if bin_size not in query_builder.VOLUME_BINS:
+            return jsonify({"error": f"bin must be one of {', '.join(query_builder.VOLUME_BINS)}."}), 400
+        if start_ms is not None and end_ms is not None and start_ms > end_ms:
+            return jsonify({"error": "start must not be after end."}), 400
+
+        query, parameters = query_builder.build_volume_query(
+            tables,
+            subreddit=subreddit,
+            start_ms=start_ms,
+            end_ms=end_ms,
+            bin_size=bin_size
+        )
+        client = get_pooled_client()
+        start_time = time.time()
+        result = client.query(query, parameters=parameters, settings=_query_settings())
+        metrics.observe_query(request.endpoint, time.time() - start_time, len(result.result_rows))
+        t, posts, authors = (list(col) for col in zip(*result.result_rows)) if result.result_rows else ([], [], [])
+        return jsonify({
+            "subreddit": subreddit,
+            "bin": bin_size,
+            "t": [int(v) for v in t],
+            "posts": [int(v) for v in posts],
+            "authors": [int(v) for v in authors]
+        }), 200
+    except Exception as e:
+        broken = True
+        return _error_response(e)
+    finally:
+        release_client(client, broken)
+
 
 @clickHouse_BP.route("/api/run_topic", methods=["POST"])
 def run_topic():
@@ -207,6 +992,12 @@ def run_topic():
         # Retrieve parameters from the POST body.
         request_data = request.get_json() or {}
 
+        try:
+            query_builder.parse_sample(request_data.get("sample"))
+            int(request_data.get("sample_seed", query_builder.DEFAULT_SAMPLE_SEED))
+        except (TypeError, ValueError):
+            return jsonify({"error": "sample must be a row count or a fraction between 0 and 1."}), 400
+
         # generate job id to track progress on the frontend
         job_id = str(uuid.uuid4())
         requester_client_id = _request_client_id()
@@ -220,6 +1011,8 @@ def run_topic():
             "option": request_data.get("option", "reddit_submissions"),
             "startDate": request_data.get("startDate", ""),
             "endDate": request_data.get("endDate", ""),
+            "sample": request_data.get("sample", ""),
+            "sample_seed": request_data.get("sample_seed", query_builder.DEFAULT_SAMPLE_SEED),
         }
         message = json.dumps(parameters)
         
@@ -235,7 +1028,7 @@ def run_topic():
         }), 200
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error_response(e)
 
 
 @clickHouse_BP.route("/api/get_result/<job_id>")
@@ -303,11 +1096,83 @@ def run_sentiment():
             "job_id": job_id
         }), 200
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error_response(e)
+
+
+@clickHouse_BP.route("/api/export_job", methods=["POST"])
+def export_job():
+    """
+    Queue an export for app.export_consumer, which writes the file to disk batch by
+    batch. Progress (rows written) is at /api/progress/<job_id>; the result carries
+    the download URL.
+    """
+    try:
+        request_data = request.get_json() or {}
+        export_format = request_data.get("format", "csv")
+        option = request_data.get("option", "reddit_submissions")
+        search_mode = request_data.get("search_mode", "substring")
+        timezone_name = request_data.get("timezone") or export_writers.EXPORT_TIMEZONE
+
+        if not export_writers.valid_timezone(timezone_name):
+            return jsonify({"error": "timezone must be an IANA timezone name such as America/New_York."}), 400
+        if export_format not in export_writers.EXPORT_FORMATS:
+            return jsonify({"error": f"format must be one of {', '.join(export_writers.EXPORT_FORMATS)}."}), 400
+        if search_mode not in query_builder.SEARCH_MODES:
+            return jsonify({"error": f"search_mode must be one of {', '.join(query_builder.SEARCH_MODES)}."}), 400
+        if not query_builder.option_tables(option):
+            return jsonify({"error": "Invalid option provided."}), 400
+
+        job_id = str(uuid.uuid4())
+        requester_client_id = _request_client_id()
+        redis.set_job_owner(job_id, requester_client_id)
+
+        parameters = {
+            "job_id": job_id,
+            "client_id": requester_client_id,
+            "format": export_format,
+            "option": option,
+            "subreddit": request_data.get("subreddit", ""),
+            "startDate": request_data.get("startDate", ""),
+            "endDate": request_data.get("endDate", ""),
+            "search_value": request_data.get("search_value", ""),
+            "search_mode": search_mode,
+            "timezone": timezone_name,
+        }
+        redis.set_progress(job_id, {"job_id": job_id, "stage": "queued", "message": "Export queued", "percent": 0})
+        ExportRpcClient().send_job(json.dumps(parameters), job_id)
+
+        return jsonify({
+            "job_id": job_id
+        }), 200
+    except Exception as e:
+        return _error_response(e)
+
+
+@clickHouse_BP.route("/api/export_job/<job_id>/download", methods=["GET"])
+def download_export(job_id):
+    if not _is_authorized_for_job(job_id):
+        return jsonify({"error": "This job belongs to a different client."}), 403
+
+    result = _decode_cached_payload(redis.get_result(job_id))
+    if not isinstance(result, dict) or "download_url" not in result:
+        return jsonify({"error": "Export is not ready."}), 404
+
+    path = export_writers.export_path(job_id, result["format"])
+    if not os.path.exists(path):
+        return jsonify({"error": "Export file has expired."}), 410
+    return send_file(
+        path,
+        mimetype=export_writers.EXPORT_FORMATS[result["format"]][1],
+        as_attachment=True,
+        download_name=result["filename"]
+    )
 
 
 @clickHouse_BP.route("/api/export_data", methods=["GET"])
 def export_data():
+    client = None
+    ticket = None
+    broken = False
     try:
         option = request.args.get('option', default='reddit_submissions')
         subreddit = request.args.get('subreddit', '', type=str)
@@ -317,95 +1182,73 @@ def export_data():
         start_date = request.args.get('startDate', None, type=str)
         end_date = request.args.get('endDate', None, type=str)
         export_format = request.args.get('format', default='csv')
+        search_mode = request.args.get('search_mode', 'substring', type=str)
+        timezone_name = request.args.get('timezone', export_writers.EXPORT_TIMEZONE, type=str)
 
+        if search_mode not in query_builder.SEARCH_MODES:
+            return jsonify({"error": f"search_mode must be one of {', '.join(query_builder.SEARCH_MODES)}."}), 400
 
-        if ',' in option:
-            # If both options are selected, use a UNION ALL query.
-            base_query = (
-                "SELECT * FROM ("
-                "    (SELECT subreddit, title, selftext, created_utc, id FROM reddit_submissions) "
-                "    UNION ALL "
-                "    (SELECT subreddit, '(Comment)' AS title, body AS selftext, created_utc, parent_id AS id FROM reddit_comments)"
-                ") AS combined"
-            )
-        elif option == "reddit_submissions":
-            base_query = "SELECT subreddit, title, selftext, created_utc, id FROM reddit_submissions"
-        elif option == "reddit_comments":
-            base_query = "SELECT subreddit, '(Comment)' AS title, body AS selftext, created_utc, parent_id AS id FROM reddit_comments"
+        if not export_writers.valid_timezone(timezone_name):
+            return jsonify({"error": "timezone must be an IANA timezone name such as America/New_York."}), 400
 
-        else:
+        codec = _arrow_codec()
+        if codec is None:
+            return jsonify({"error": f"compression must be one of {', '.join(ARROW_COMPRESSION_CODECS)}."}), 400
+
+        tables = query_builder.option_tables(option)
+        if not tables:
             return jsonify({"error": "Invalid option provided."}), 400
-        conditions = []
-        if subreddit:
-            conditions.append(f"subreddit = '{subreddit}'")
-        # Use search_value to filter by the body/selftext column.
-        if search_value:
-            conditions.append(f"selftext LIKE '%{search_value}%'")
-        if start_date:
-            start_date_formatted = start_date.replace("T", " ").split(".")[0]
-            conditions.append(f"created_utc >= toDateTime64('{start_date_formatted}', 3)")
-        if end_date:
-            end_date_formatted = end_date.replace("T", " ").split(".")[0]
-            conditions.append(f"created_utc <= toDateTime64('{end_date_formatted}', 3)")
-
-        query = base_query
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        query += " ORDER BY created_utc DESC"
+
+        filters = dict(
+            subreddit=subreddit,
+            start_date=start_date,
+            end_date=end_date,
+            search_value=search_value,
+            search_mode=search_mode,
+            exclude_automoderator=False
+        )
+        query, parameters = query_builder.build_dataset_query(tables, query_builder.EXPORT_COLUMNS, **filters)
+        projection = query_builder.projection_settings(subreddit, start_date, end_date)
+        # Admission estimates the combined query; the data itself is read per table.
+        stream_query = _table_queries(
+            tables, query_builder.EXPORT_COLUMNS, filters, _arg_flag('ordered', True)
+        ) or query
+
+        if export_format not in export_writers.EXPORT_FORMATS:
+            return jsonify({"error": "Unsupported export format."}), 400
 
         client = get_pooled_client()
-        table = client.query_arrow(query, use_strings=True)
-
-        # Process different export formats...
-        if export_format == 'excel':
-            df = table.to_pandas()
-            import pytz
-            local_tz = pytz.timezone("America/New_York")  # Adjust to your timezone.
-            if 'created_utc' in df.columns:
-                if pd.api.types.is_datetime64tz_dtype(df['created_utc']):
-                    df['created_utc'] = df['created_utc'].dt.tz_convert(local_tz).dt.tz_localize(None)
-                else:
-                    df['created_utc'] = pd.to_datetime(df['created_utc'], utc=True).dt.tz_convert(local_tz).dt.tz_localize(None)
-            output = BytesIO()
-            df.to_excel(output, index=False, sheet_name="Reddit Export")
-            output.seek(0)
-            # Dynamically name the file using the subreddit value.
-            filename = f"{subreddit}.xlsx" if subreddit else "reddit_export.xlsx"
-            return Response(
-                output.getvalue(),
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                headers={"Content-Disposition": f"attachment; filename={filename}"}
-            )
-        elif export_format == 'csv':
-            df = table.to_pandas()
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            output.seek(0)
-            return Response(
-                output.getvalue(), 
-                mimetype='text/csv', 
-                headers={"Content-Disposition": f"attachment; filename={subreddit}.csv" if subreddit else "attachment; filename=reddit_export.csv"}
-            )
-        elif export_format == 'json':
-            df = table.to_pandas()
-            return jsonify(df.to_dict(orient='records'))
-        elif export_format == 'arrow':
-            stream = io.BytesIO()
-            with ipc.new_stream(stream, table.schema) as writer:
-                writer.write_table(table)
-            stream.seek(0)
-            return Response(
-                stream.getvalue(), 
-                mimetype='application/vnd.apache.arrow.stream',
-                headers={"Content-Disposition": "attachment; filename=data.arrow"}
+        ticket = admission.admit(client, query, parameters, _admission_client_id(), projection)
+        if export_format == 'arrow':
+            # Same batch-by-batch IPC stream as get_arrow; the response releases the client.
+            stream_client, client = client, None
+            stream_ticket, ticket = ticket, None
+            settings = _query_settings({**_arrow_settings(), **projection})
+            return _stream_arrow_response(stream_client, stream_query, parameters, settings, codec=codec,
+                                          ticket=stream_ticket)
+
+        if export_format in ('csv', 'json', 'ndjson'):
+            stream_client, client = client, None
+            stream_ticket, ticket = ticket, None
+            filename = None
+            if export_format != 'json':
+                filename = export_writers.download_name(subreddit, export_format)
+            return _stream_export_response(
+                stream_client, stream_query, parameters, _query_settings(projection), export_format, filename,
+                stream_ticket
             )
-        else:
-            return jsonify({"error": "Unsupported export format."}), 400
+
+        stream_client, client = client, None
+        return _excel_export_response(
+            stream_client, stream_query, parameters, _query_settings(projection), subreddit, timezone_name
+        )
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        broken = True
+        return _error_response(e)
     finally:
-        release_client(client)
+        release_client(client, broken)
+        admission.release(ticket)
 
 
 def _decode_cached_payload(value):
@@ -0,0 +1,108 @@
+import os
+import time
+import heapq
+import bisect
+import threading
+
+# How often each worker reloads subreddit names and activity from ClickHouse.
+SUBREDDIT_INDEX_REFRESH_SECONDS = int(os.getenv("SUBREDDIT_INDEX_REFRESH_SECONDS", 600))
+# Prefixes up to this length get their top suggestions precomputed; longer prefixes
+# match few enough names to rank on the fly.
+PRECOMPUTED_PREFIX_LENGTH = 2
+MAX_SUGGESTIONS = 10
+
+# Names from the `subreddits` table ranked by rows ingested, from the daily volume table.
+RANKED_SUBREDDITS_QUERY = (
+    "SELECT s.subreddit, coalesce(v.posts, 0) AS posts "
+    "FROM subreddits AS s "
+    "LEFT JOIN (SELECT subreddit, sum(posts) AS posts FROM reddit_daily_volume GROUP BY subreddit) AS v "
+    "ON s.subreddit = v.subreddit"
+)
+SUBREDDITS_QUERY = "SELECT subreddit, 0 FROM subreddits"
+
+
+class SubredditIndex:
+    """
+    In-process prefix index over subreddit names for /api/search_list.
+
+    Lowercased names are kept sorted so a prefix maps to one contiguous slice found
+    with bisect; suggestions in that slice are ranked by activity. The whole index
+    is rebuilt in a background thread and swapped in with a single assignment.
+    """
+
+    def __init__(self, loader, refresh_seconds=SUBREDDIT_INDEX_REFRESH_SECONDS):
+        self._loader = loader
+        self._refresh_seconds = refresh_seconds
+        self._index = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.loaded_at = None
+
+    def start(self):
+        """
+        Start the refresh thread once per process.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._refresh_forever, daemon=True)
+                self._thread.start()
+
+    def _refresh_forever(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Subreddit index refresh failed: {e}", flush=True)
+            time.sleep(self._refresh_seconds)
+
+    def refresh(self):
+        start_time = time.time()
+        self._index = self.build(self._loader())
+        self.loaded_at = time.time()
+        print(f"Subreddit index: {len(self._index[0]):,} names loaded in "
+              f"{time.time() - start_time:.2f} seconds", flush=True)
+
+    @staticmethod
+    def build(rows):
+        """
+        Build (keys, names, scores, top) from (subreddit, activity) rows. `top` maps
+        every short prefix to its precomputed suggestions.
+        """
+        entries = sorted((name.lower(), name, int(score)) for name, score in rows if name)
+        keys = [entry[0] for entry in entries]
+        names = [entry[1] for entry in entries]
+        scores = [entry[2] for entry in entries]
+
+        candidates = {}
+        for i, key in enumerate(keys):
+            for length in range(1, min(PRECOMPUTED_PREFIX_LENGTH, len(key)) + 1):
+                heap = candidates.setdefault(key[:length], [])
+                item = (scores[i], -i)
+                if len(heap) < MAX_SUGGESTIONS:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+        top = {
+            prefix: [names[-negated_i] for _, negated_i in sorted(heap, reverse=True)]
+            for prefix, heap in candidates.items()
+        }
+        return keys, names, scores, top
+
+    def suggest(self, prefix, limit=MAX_SUGGESTIONS):
+        """
+        Most active subreddits whose name starts with `prefix` (case-insensitive),
+        or None while the index has not been loaded yet.
+        """
+        index = self._index
+        if index is None:
+            return None
+        keys, names, scores, top = index
+        prefix = prefix.lower()
+        limit = min(limit, MAX_SUGGESTIONS)
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return top.get(prefix, [])[:limit]
+
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + "\U0010ffff", lo)
+        best = heapq.nlargest(limit, range(lo, hi), key=lambda i: (scores[i], -i))
+        return [names[i] for i in best]
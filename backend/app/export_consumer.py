@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import functools
+import threading
+import traceback
+
+import pyarrow.ipc as ipc
+
+from app.progress_consumer import create_connection
+from app.redis_client import set_progress, set_result, RESULT_TTL_SECONDS
+from common import query_builder
+from app.clickHouse import export_writers
+from app.clickHouse.routes import get_new_client
+
+EXPORT_QUEUE = "export_queue"
+# Publish a progress update at most this often while rows are being written.
+PROGRESS_INTERVAL_SECONDS = 2
+
+
+def _publish(job_id, stage, message, percent, **extra):
+    set_progress(job_id, {
+        "job_id": job_id,
+        "stage": stage,
+        "message": message,
+        "percent": percent,
+        **extra
+    })
+
+
+def remove_expired_exports(max_age=RESULT_TTL_SECONDS):
+    """
+    Delete export files older than the job results that point at them.
+    """
+    if not os.path.isdir(export_writers.EXPORT_DIR):
+        return
+    cutoff = time.time() - max_age
+    with os.scandir(export_writers.EXPORT_DIR) as it:
+        for entry in it:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+
+
+def run_export(job):
+    """
+    Stream one export job from ClickHouse into a file under EXPORT_DIR and return
+    the job result.
+    """
+    job_id = job["job_id"]
+    export_format = job["format"]
+    tables = query_builder.option_tables(job["option"])
+    filters = dict(
+        subreddit=job.get("subreddit", ""),
+        start_date=job.get("startDate") or None,
+        end_date=job.get("endDate") or None,
+        search_value=job.get("search_value", ""),
+        search_mode=job.get("search_mode", "substring"),
+        exclude_automoderator=False
+    )
+    query, parameters = query_builder.build_dataset_query(tables, query_builder.EXPORT_COLUMNS, **filters)
+    count_query, count_parameters = query_builder.build_count_query(tables, **filters)
+
+    client = get_new_client()
+    try:
+        _publish(job_id, "count", "Counting matching rows", 0)
+        total = client.query(count_query, parameters=count_parameters).result_rows[0][0]
+
+        path = export_writers.export_path(job_id, export_format)
+        tmp_path = path + ".tmp"
+        last_update = 0
+
+        def on_batch(rows):
+            nonlocal last_update
+            if time.time() - last_update >= PROGRESS_INTERVAL_SECONDS:
+                last_update = time.time()
+                _publish(job_id, "export", f"{rows:,} of {total:,} rows written",
+                         min(rows / total, 0.99) if total else 0, rows=rows, total=total)
+
+        raw = client.raw_stream(
+            query,
+            parameters=parameters,
+            settings={
+                "output_format_arrow_string_as_string": 1,
+                **query_builder.projection_settings(filters["subreddit"], filters["start_date"], filters["end_date"])
+            },
+            fmt="ArrowStream"
+        )
+        try:
+            with open(tmp_path, "wb") as fh:
+                rows = export_writers.write_export(
+                    ipc.open_stream(raw), export_format, fh, on_batch, timezone_name=job.get("timezone")
+                )
+            os.replace(tmp_path, path)
+        finally:
+            raw.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    finally:
+        client.close()
+
+    return {
+        "job_id": job_id,
+        "format": export_format,
+        "rows": rows,
+        "bytes": os.path.getsize(path),
+        "filename": export_writers.download_name(job.get("subreddit", ""), export_format),
+        "download_url": f"/api/export_job/{job_id}/download"
+    }
+
+
+def start_export_listener():
+    """Consume export jobs one at a time."""
+    while True:
+        try:
+            connection = create_connection()
+            channel = connection.channel()
+            channel.queue_declare(queue=EXPORT_QUEUE, durable=True)
+            # Exports are long and disk heavy; never hold more than one unacked job.
+            channel.basic_qos(prefetch_count=1)
+
+            def handle(ch, delivery_tag, properties, body):
+                job_id = properties.correlation_id
+                try:
+                    job = json.loads(body)
+                    job_id = job.get("job_id", job_id)
+                    remove_expired_exports()
+                    result = run_export(job)
+                    set_result(job_id, result)
+                    _publish(job_id, "done", "done", 1, rows=result["rows"])
+                    print(f"Export {job_id} finished: {result['rows']:,} rows", flush=True)
+
+                except Exception as e:
+                    print(f"Export {job_id} failed:", e)
+                    print(traceback.format_exc())
+                    if job_id:
+                        set_result(job_id, {"job_id": job_id, "error": str(e)})
+                        _publish(job_id, "error", str(e), 1)
+
+                finally:
+                    connection.add_callback_threadsafe(functools.partial(ch.basic_ack, delivery_tag=delivery_tag))
+
+            def callback(ch, method, properties, body):
+                # Run the export off the connection thread so heartbeats keep flowing
+                # during long exports; the ack is handed back to this thread when done.
+                threading.Thread(
+                    target=handle,
+                    args=(ch, method.delivery_tag, properties, body),
+                    daemon=True
+                ).start()
+
+            channel.basic_consume(queue=EXPORT_QUEUE, on_message_callback=callback)
+
+            print(f" [*] Listening for export jobs on queue: {EXPORT_QUEUE}")
+            channel.start_consuming()
+
+        except Exception as e:
+            print("Export listener crashed:", e)
+            print(traceback.format_exc())
+            print("Retrying in 5 seconds...")
+            time.sleep(5)
+
+
+if __name__ == "__main__":
+    start_export_listener()
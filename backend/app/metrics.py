@@ -0,0 +1,204 @@
+import os
+import time
+import functools
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR (set in
+# gunicorn.conf.py) and /metrics aggregates the files, so any worker can answer a scrape.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# RabbitMQ queues whose depth is read at scrape time.
+MONITORED_QUEUES = ["topic_model_queue", "sentiment_analysis_queue", "export_queue"]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+ROW_BUCKETS = (0, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+BYTE_BUCKETS = (1_024, 16_384, 131_072, 1_048_576, 16_777_216, 134_217_728, 1_073_741_824, 8_589_934_592)
+
+REQUEST_SECONDS = Histogram(
+    "ocss_http_request_duration_seconds",
+    "Time from request start until the response body has been sent.",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    "ocss_http_response_bytes",
+    "Response body size.",
+    ["endpoint"],
+    buckets=BYTE_BUCKETS,
+)
+CH_QUERY_SECONDS = Histogram(
+    "ocss_clickhouse_query_seconds",
+    "ClickHouse time per query: full query for buffered reads, time to first batch for streams.",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+SERIALIZATION_SECONDS = Histogram(
+    "ocss_serialization_seconds",
+    "Time spent encoding query results for the response.",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+CH_ROWS = Histogram(
+    "ocss_clickhouse_rows",
+    "Rows returned per ClickHouse query.",
+    ["endpoint"],
+    buckets=ROW_BUCKETS,
+)
+CH_POOL_WAIT_SECONDS = Histogram(
+    "ocss_clickhouse_pool_wait_seconds",
+    "Time spent waiting to check a client out of the pool.",
+    buckets=FAST_BUCKETS,
+)
+CH_POOL_EXHAUSTED = Counter(
+    "ocss_clickhouse_pool_exhausted",
+    "Checkouts that timed out because every client was in use.",
+)
+REDIS_SECONDS = Histogram(
+    "ocss_redis_operation_seconds",
+    "Latency of Redis helper calls.",
+    ["operation"],
+    buckets=FAST_BUCKETS,
+)
+RABBITMQ_SECONDS = Histogram(
+    "ocss_rabbitmq_operation_seconds",
+    "Latency of RabbitMQ operations (connect + publish).",
+    ["operation", "queue"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def _endpoint():
+    return request.endpoint or "unknown"
+
+
+def timed(histogram, *labels):
+    """
+    Decorator that records each call's duration in `histogram` (with `labels`).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with (histogram.labels(*labels) if labels else histogram).time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_query(endpoint, seconds, rows=None):
+    CH_QUERY_SECONDS.labels(endpoint).observe(seconds)
+    if rows is not None:
+        CH_ROWS.labels(endpoint).observe(rows)
+
+
+def observe_serialization(endpoint, seconds):
+    SERIALIZATION_SECONDS.labels(endpoint).observe(seconds)
+
+
+class QueueDepthCollector:
+    """
+    Reads RabbitMQ queue depths when /metrics is scraped, so no process has to poll.
+    """
+
+    def collect(self):
+        import pika
+        from app.rpc_client import _rabbitmq_connection_parameters
+
+        family = GaugeMetricFamily(
+            "ocss_rabbitmq_queue_messages",
+            "Messages waiting in a RabbitMQ queue.",
+            labels=["queue"],
+        )
+        try:
+            connection = pika.BlockingConnection(_rabbitmq_connection_parameters())
+        except Exception as e:
+            print(f"Queue depth scrape failed: {e}", flush=True)
+            return
+        try:
+            for queue in MONITORED_QUEUES:
+                channel = connection.channel()
+                try:
+                    declared = channel.queue_declare(queue=queue, passive=True)
+                    family.add_metric([queue], declared.method.message_count)
+                except Exception:
+                    # Passive declare closes the channel when the queue does not exist yet.
+                    continue
+        finally:
+            connection.close()
+        yield family
+
+
+def _start_timer():
+    g.metrics_start = time.monotonic()
+
+
+def _record_response(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    endpoint = _endpoint()
+    labels = (endpoint, request.method, str(response.status_code))
+    sent = [0]
+
+    if response.is_streamed and not response.direct_passthrough:
+        # Count streamed bytes as they go out; send_file responses keep their
+        # file wrapper untouched so gunicorn can still use sendfile().
+        body = response.response
+
+        def counted():
+            try:
+                for chunk in body:
+                    sent[0] += len(chunk)
+                    yield chunk
+            finally:
+                # Let the original iterable clean up if the client disconnects.
+                if hasattr(body, "close"):
+                    body.close()
+
+        response.response = counted()
+    else:
+        sent[0] = response.content_length or 0
+
+    def observe():
+        REQUEST_SECONDS.labels(*labels).observe(time.monotonic() - start)
+        RESPONSE_BYTES.labels(endpoint).observe(sent[0])
+
+    response.call_on_close(observe)
+    return response
+
+
+def metrics_view():
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = CollectorRegistry()
+        registry.register(_DefaultCollectors())
+    registry.register(QueueDepthCollector())
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+class _DefaultCollectors:
+    """
+    Exposes the process-local default registry next to the scrape-time collectors.
+    """
+
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def init_app(app):
+    app.before_request(_start_timer)
+    app.after_request(_record_response)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
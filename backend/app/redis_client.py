@@ -2,6 +2,9 @@ import redis
 import os
 import time
 import json
+import functools
+
+from app.metrics import REDIS_SECONDS
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
@@ -40,9 +43,21 @@ def get_redis_connection(retries=20, delay=1):
     raise Exception("[Redis] Could not connect after retries")
 
 
+def _timed(func):
+    """
+    Record each helper's round trip in the ocss_redis_operation_seconds histogram.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with REDIS_SECONDS.labels(func.__name__).time():
+            return func(*args, **kwargs)
+    return wrapper
+
+
 # -----------------------------
 # Result helpers
 # -----------------------------
+@_timed
 def set_result(job_id: str, result: dict):
     """
     Store the final job result in Redis with TTL.
@@ -52,6 +67,7 @@ def set_result(job_id: str, result: dict):
     r.set(f"result:{job_id}", payload, ex=RESULT_TTL_SECONDS)
 
 
+@_timed
 def get_result(job_id: str):
     """
     Retrieve the final job result from Redis.
@@ -66,6 +82,7 @@ def get_result(job_id: str):
 # -----------------------------
 # Progress helpers
 # -----------------------------
+@_timed
 def set_progress(job_id: str, progress: dict):
     """
     Store a job's progress update in Redis with TTL.
@@ -75,6 +92,7 @@ def set_progress(job_id: str, progress: dict):
     r.set(f"progress:{job_id}", payload, ex=PROGRESS_TTL_SECONDS)
 
 
+@_timed
 def get_progress(job_id: str):
     """
     Retrieve a job's progress update from Redis.
@@ -89,6 +107,7 @@ def get_progress(job_id: str):
 # -----------------------------
 # Job owner helpers
 # -----------------------------
+@_timed
 def set_job_owner(job_id: str, client_id: str):
     """
     Store which client created the job, used to gate progress/result reads.
@@ -97,9 +116,173 @@ def set_job_owner(job_id: str, client_id: str):
     r.set(f"job_owner:{job_id}", client_id, ex=JOB_OWNER_TTL_SECONDS)
 
 
+@_timed
 def get_job_owner(job_id: str):
     """
     Retrieve the client that owns the job.
     """
     r = get_redis_connection()
     return r.get(f"job_owner:{job_id}")
+
+
+# -----------------------------
+# Arrow cache helpers
+# -----------------------------
+@_timed
+def get_cache_generation(subreddit: str):
+    """
+    Return the ingest generation for a subreddit's cached results ("" means the
+    cross-subreddit queries). Combined with the global generation.
+    """
+    r = get_redis_connection()
+    global_gen, subreddit_gen = r.mget("arrow_cache_gen:*", f"arrow_cache_gen:{subreddit}")
+    return f"{global_gen or 0}.{subreddit_gen or 0}"
+
+
+@_timed
+def bump_cache_generation(subreddits):
+    """
+    Invalidate cached results for the given subreddits. Cross-subreddit results
+    are always invalidated too; an empty list invalidates everything.
+    """
+    r = get_redis_connection()
+    pipe = r.pipeline()
+    if not subreddits:
+        pipe.incr("arrow_cache_gen:*")
+    for subreddit in subreddits:
+        pipe.incr(f"arrow_cache_gen:{subreddit}")
+    pipe.incr("arrow_cache_gen:")
+    pipe.execute()
+
+
+@_timed
+def incr_cache_counter(name: str):
+    """
+    Count an Arrow cache event (hits/misses) across all workers.
+    """
+    r = get_redis_connection()
+    r.hincrby("arrow_cache:counters", name, 1)
+
+
+@_timed
+def set_cache_headers(key: str, headers: dict, ttl: int):
+    """
+    Remember the extra response headers (e.g. the sample population) of a cached result.
+    """
+    r = get_redis_connection()
+    r.set(f"arrow_cache:headers:{key}", json.dumps(headers), ex=ttl)
+
+
+@_timed
+def get_cache_headers(key: str):
+    """
+    Headers stored by set_cache_headers, or None.
+    """
+    r = get_redis_connection()
+    value = r.get(f"arrow_cache:headers:{key}")
+    return json.loads(value) if value else None
+
+
+@_timed
+def get_cache_counters():
+    """
+    Retrieve the Arrow cache counters.
+    """
+    r = get_redis_connection()
+    return {name: int(value) for name, value in r.hgetall("arrow_cache:counters").items()}
+
+
+# -----------------------------
+# Single-flight helpers
+# -----------------------------
+# Update a flight only while it is still running and owned by the same spill file, so
+# a leader whose lease expired cannot overwrite the flight that replaced it.
+_UPDATE_FLIGHT_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then return 0 end
+local flight = cjson.decode(current)
+if flight.path ~= ARGV[1] or flight.state ~= 'running' then return 0 end
+flight.state = ARGV[2]
+redis.call('SET', KEYS[1], cjson.encode(flight), 'EX', ARGV[3])
+return 1
+"""
+
+
+@_timed
+def claim_flight(key: str, path: str, ttl: int):
+    """
+    Register the caller as the only runner of query `key`, spilling to `path`.
+    Returns False when another worker already holds the flight.
+    """
+    r = get_redis_connection()
+    flight = json.dumps({"state": "running", "path": path})
+    return bool(r.set(f"arrow_flight:{key}", flight, nx=True, ex=ttl))
+
+
+@_timed
+def get_flight(key: str):
+    """
+    Retrieve the in-flight record for query `key` ({"state", "path"}), if any.
+    """
+    r = get_redis_connection()
+    data = r.get(f"arrow_flight:{key}")
+    return json.loads(data) if data else None
+
+
+@_timed
+def update_flight(key: str, path: str, state: str, ttl: int):
+    """
+    Renew ("running") or finish ("done"/"failed") the caller's flight.
+    """
+    r = get_redis_connection()
+    return bool(r.eval(_UPDATE_FLIGHT_SCRIPT, 1, f"arrow_flight:{key}", path, state, ttl))
+
+
+# -----------------------------
+# Admission control helpers
+# -----------------------------
+# Slots are sorted-set members scored by their expiry, so slots held by a worker
+# that died are dropped the next time anyone tries to acquire one.
+_ACQUIRE_SLOT_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[4]) then return 'client' end
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then return 'global' end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[5]), ARGV[2])
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[5]), ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return ''
+"""
+
+
+@_timed
+def acquire_admission_slot(client_id: str, token: str, global_limit: int, client_limit: int, ttl: int):
+    """
+    Take a heavy-query slot. Returns "" on success, or "client"/"global" naming
+    the limit that is full.
+    """
+    r = get_redis_connection()
+    return r.eval(
+        _ACQUIRE_SLOT_SCRIPT, 2, "admission:heavy", f"admission:heavy:{client_id}",
+        time.time(), token, global_limit, client_limit, ttl
+    )
+
+
+@_timed
+def release_admission_slot(client_id: str, token: str):
+    r = get_redis_connection()
+    pipe = r.pipeline()
+    pipe.zrem("admission:heavy", token)
+    pipe.zrem(f"admission:heavy:{client_id}", token)
+    pipe.execute()
+
+
+@_timed
+def get_admission_counts():
+    """
+    Heavy queries currently holding a slot, across all workers.
+    """
+    r = get_redis_connection()
+    r.zremrangebyscore("admission:heavy", "-inf", time.time())
+    return {"heavy_running": r.zcard("admission:heavy")}
@@ -1,6 +1,8 @@
 import os
 import pika
 
+from app.metrics import RABBITMQ_SECONDS, timed
+
 
 def _rabbitmq_connection_parameters():
     """Build RabbitMQ connection params from environment settings."""
@@ -25,6 +27,7 @@ class TopicModelRpcClient:
         self.connection_parameters = _rabbitmq_connection_parameters()
         print("Initializing TopicModelRpcClient...")
 
+    @timed(RABBITMQ_SECONDS, "publish", "topic_model_queue")
     def send_job(self, message: str, job_id: str):
         """
         Send a topic modeling job to RabbitMQ asynchronously.
@@ -53,6 +56,7 @@ class SentimentAnalysisRpcClient:
         self.connection_parameters = _rabbitmq_connection_parameters()
         print('Initializing SentimentAnalysisRpcClient...')
 
+    @timed(RABBITMQ_SECONDS, "publish", "sentiment_analysis_queue")
     def send_job(self, message: str, job_id: str):
         """Send job asynchronously; frontend tracks progress separately."""
         connection = pika.BlockingConnection(self.connection_parameters)
@@ -71,3 +75,31 @@ class SentimentAnalysisRpcClient:
             connection.close()
 
         print(f"Sent sentiment analysis job {job_id} to sentiment_analysis_queue")
+
+
+# RPC client for export jobs written to disk by app.export_consumer
+class ExportRpcClient:
+    def __init__(self):
+        self.connection_parameters = _rabbitmq_connection_parameters()
+        print('Initializing ExportRpcClient...')
+
+    @timed(RABBITMQ_SECONDS, "publish", "export_queue")
+    def send_job(self, message: str, job_id: str):
+        """Queue an export; the frontend polls /api/progress/<job_id> for rows written."""
+        connection = pika.BlockingConnection(self.connection_parameters)
+        try:
+            channel = connection.channel()
+            channel.queue_declare(queue='export_queue', durable=True)
+            channel.basic_publish(
+                exchange='',
+                routing_key='export_queue',
+                properties=pika.BasicProperties(
+                    correlation_id=job_id,
+                    delivery_mode=2
+                ),
+                body=message
+            )
+        finally:
+            connection.close()
+
+        print(f"Sent export job {job_id} to export_queue")
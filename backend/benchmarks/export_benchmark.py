@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Compare the streaming export encoders with the pandas path export_data used to take.
+# Each method runs in a fresh interpreter so peak memory is measured per method.
+#
+#   cd backend && python -m benchmarks.export_benchmark --subreddit AskReddit --option reddit_comments
+#
+# Needs the same CH_* environment as the app (run it inside the app container).
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+METHODS = ["pandas_csv", "pandas_json", "stream_csv", "stream_json", "stream_ndjson"]
+
+
+def _rss_mib():
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_method(method, args):
+    from clickhouse_connect import get_client
+    import pyarrow.ipc as ipc
+    from common import query_builder
+    from app.clickHouse import export_writers
+
+    client = get_client(
+        host=os.getenv('CH_HOST'),
+        port=os.getenv('CH_PORT'),
+        database=os.getenv('CH_DATABASE'),
+        username=os.getenv('CH_USER'),
+        password=os.getenv('CH_PASSWORD')
+    )
+    query, parameters = query_builder.build_dataset_query(
+        query_builder.option_tables(args.option),
+        query_builder.EXPORT_COLUMNS,
+        subreddit=args.subreddit,
+        exclude_automoderator=False
+    )
+    if args.limit:
+        query += f" LIMIT {int(args.limit)}"
+    settings = {"use_query_cache": 0, "output_format_arrow_string_as_string": 1}
+
+    baseline = _rss_mib()
+    start = time.time()
+    size = 0
+    if method.startswith("pandas_"):
+        df = client.query_arrow(query, parameters=parameters, settings=settings, use_strings=True).to_pandas()
+        rows = len(df)
+        if method == "pandas_csv":
+            output = io.StringIO()
+            df.to_csv(output, index=False)
+            size = len(output.getvalue().encode("utf-8"))
+        else:
+            size = len(json.dumps(df.to_dict(orient="records"), default=str).encode("utf-8"))
+    else:
+        rows = 0
+
+        def count(written):
+            nonlocal rows
+            rows = written
+
+        raw = client.raw_stream(query, parameters=parameters, settings=settings, fmt="ArrowStream")
+        try:
+            export_format = method[len("stream_"):]
+            for chunk in export_writers.iter_export_chunks(ipc.open_stream(raw), export_format, on_batch=count):
+                size += len(chunk)
+        finally:
+            raw.close()
+    elapsed = time.time() - start
+
+    return {
+        "method": method,
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else None,
+        "mib": round(size / 1024 ** 2, 1),
+        "peak_rss_mib_over_baseline": round(_rss_mib() - baseline, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark export encoders: pandas vs. streaming.")
+    parser.add_argument("--subreddit", default="", help="subreddit to export")
+    parser.add_argument("--option", default="reddit_submissions", help="table option, as for export_data")
+    parser.add_argument("--limit", type=int, default=0, help="cap the number of rows (0 = all)")
+    parser.add_argument("--method", choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        print(json.dumps(run_method(args.method, args)))
+        return
+
+    print(f"{'method':<15}{'rows':>12}{'seconds':>10}{'rows/s':>12}{'MiB':>10}{'peak RSS MiB':>15}")
+    for method in METHODS:
+        cmd = [sys.executable, "-m", "benchmarks.export_benchmark", "--method", method,
+               "--subreddit", args.subreddit, "--option", args.option, "--limit", str(args.limit)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{result['method']:<15}{result['rows']:>12,}{result['seconds']:>10}"
+              f"{result['rows_per_second'] or 0:>12,}{result['mib']:>10}{result['peak_rss_mib_over_baseline']:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Dataset loading for the topic and sentiment workers straight from ClickHouse,
+# instead of downloading /api/get_arrow through nginx and gunicorn. Builds the same
+# queries as the API (query_builder), but per table and without the global
+# ORDER BY, and reads the Arrow record batches as ClickHouse sends each block.
+import os
+
+import pyarrow as pa
+from clickhouse_connect import get_client
+
+from common import query_builder
+
+# Compression of the ClickHouse HTTP response; lz4 is cheap to decode and still
+# shrinks Reddit text several times over.
+CH_DATA_COMPRESSION = os.getenv("CH_DATA_COMPRESSION", "lz4")
+# Rows per block ClickHouse sends, i.e. per record batch the workers receive.
+CH_DATA_BLOCK_ROWS = int(os.getenv("CH_DATA_BLOCK_ROWS", 65536))
+
+
+def get_data_client():
+    return get_client(
+        host=os.getenv('CH_HOST'),
+        port=os.getenv('CH_PORT'),
+        database=os.getenv('CH_DATABASE'),
+        username=os.getenv('CH_USER'),
+        password=os.getenv('CH_PASSWORD'),
+        compress=CH_DATA_COMPRESSION
+    )
+
+
+def dataset_queries(tables, columns=query_builder.DEFAULT_COLUMNS, **filters):
+    """
+    [(sql, parameters)] for a worker's dataset. Row order is not kept: each table is
+    read unsorted, except a row-count sample, which is a single query.
+    """
+    sample = filters.get("sample")
+    if sample and sample[0] == "rows":
+        return [query_builder.build_dataset_query(tables, list(columns), **filters)]
+    return query_builder.build_table_queries(tables, list(columns), ordered=False, **filters)
+
+
+def iter_batches(client, queries, columns=query_builder.DEFAULT_COLUMNS, settings=None):
+    """
+    Yield record batches of `columns` from each query in turn, with LowCardinality
+    columns decoded to plain values so batches from different tables line up.
+    """
+    settings = {"max_block_size": CH_DATA_BLOCK_ROWS, **(settings or {})}
+    for sql, parameters in queries:
+        with client.query_arrow_stream(sql, parameters=parameters, settings=settings, use_strings=True) as stream:
+            for batch in stream:
+                arrays = [batch.column(name) for name in columns]
+                arrays = [a.dictionary_decode() if pa.types.is_dictionary(a.type) else a for a in arrays]
+                yield pa.RecordBatch.from_arrays(arrays, names=list(columns))
+
+
+def open_dataset(subreddit, option, start_date=None, end_date=None, sample=None,
+                 sample_seed=query_builder.DEFAULT_SAMPLE_SEED, clean=False,
+                 columns=query_builder.DEFAULT_COLUMNS):
+    """
+    Start reading a dataset the way /api/get_arrow would return it (apart from row
+    order). `sample` is the raw sample value. Returns (batches, population): a generator
+    of record batches that closes its client when exhausted or closed, and the number
+    of matching rows before sampling (None when unsampled).
+    """
+    tables = query_builder.option_tables(option)
+    if not tables:
+        raise ValueError(f"Invalid option provided: {option}")
+    sample = query_builder.parse_sample(sample)
+    filters = dict(
+        subreddit=subreddit,
+        start_date=start_date or None,
+        end_date=end_date or None,
+        sample=sample,
+        sample_seed=int(sample_seed or 0),
+        clean=clean
+    )
+    settings = query_builder.projection_settings(subreddit, filters["start_date"], filters["end_date"])
+
+    client = get_data_client()
+    population = None
+    if sample:
+        count_query, count_parameters = query_builder.build_count_query(
+            tables,
+            subreddit=subreddit,
+            start_date=filters["start_date"],
+            end_date=filters["end_date"],
+            clean=clean
+        )
+        try:
+            population = client.query(count_query, parameters=count_parameters, settings=settings).result_rows[0][0]
+        except Exception:
+            client.close()
+            raise
+
+    def batches():
+        try:
+            yield from iter_batches(client, dataset_queries(tables, columns, **filters), columns, settings)
+        finally:
+            client.close()
+
+    return batches(), population
+
+
+def load_dataset(*args, columns=query_builder.DEFAULT_COLUMNS, **kwargs):
+    """
+    open_dataset() read into one pyarrow Table. Returns (table, population).
+    """
+    batches, population = open_dataset(*args, columns=columns, **kwargs)
+    batches = list(batches)
+    if not batches:
+        return pa.Table.from_batches([], schema=pa.schema([(name, pa.string()) for name in columns])), population
+    # Tables can disagree on a column's type (e.g. String vs LowCardinality already
+    # decoded, or DateTime precision); cast everything to the first table's schema.
+    schema = batches[0].schema
+    table = pa.Table.from_batches([batch if batch.schema == schema else batch.cast(schema) for batch in batches])
+    return table, population
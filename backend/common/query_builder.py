@@ -0,0 +1,386 @@
+# Reddit dataset queries shared by the /api routes and the workers that read ClickHouse
+# directly (common/ch_data.py). Request values are sent as server-side parameters
+# ({name:Type}) so the SQL text only depends on which filters are present.
+import os
+import re
+
+# Columns a dataset query can return, mapped to the expression each table provides them with.
+DATASET_COLUMNS = {
+    "reddit_submissions": {
+        "subreddit": "subreddit",
+        "author": "author",
+        "title": "title",
+        "selftext": "selftext",
+        "created_utc": "created_utc",
+        "id": "id",
+    },
+    "reddit_comments": {
+        "subreddit": "subreddit",
+        "author": "author",
+        "title": "'(Comment)'",
+        "selftext": "body",
+        "created_utc": "created_utc",
+        "id": "parent_id",
+    },
+}
+DEFAULT_COLUMNS = ["subreddit", "author", "title", "selftext", "created_utc", "id"]
+EXPORT_COLUMNS = ["subreddit", "title", "selftext", "created_utc", "id"]
+
+# search_mode values: "substring" is LIKE '%term%'; "word" matches whole tokens with
+# hasToken so the token bloom-filter skip indexes (torrent/add_search_indexes.py) can
+# prune granules.
+SEARCH_MODES = ("substring", "word")
+MAX_SEARCH_TOKENS = 8
+# ClickHouse splits tokens on non-alphanumeric ASCII; bytes >= 0x80 stay in the token.
+TOKEN_PATTERN = re.compile(r"[0-9a-z\u0080-\U0010ffff]+")
+
+# sample= draws rows by hashing each row's own id with a seed, so the same request
+# always returns the same rows. Fractions are applied as hash % SAMPLE_SCALE < threshold.
+DEFAULT_SAMPLE_SEED = int(os.getenv("SAMPLE_SEED", 0))
+SAMPLE_SCALE = 1000000
+
+# reddit_daily_volume (torrent/volume_views.py) stores one row per subreddit x day x type.
+VOLUME_TYPES = {"reddit_submissions": "submission", "reddit_comments": "comment"}
+# /api/volume bin sizes mapped to the expression that truncates `day` to the bin start.
+VOLUME_BINS = {
+    "day": "day",
+    "week": "toMonday(day)",
+    "month": "toStartOfMonth(day)",
+    "year": "toStartOfYear(day)",
+}
+
+# clean=true reads the text from the clean_body column materialized at insert time
+# (torrent/clean_body.py) and keeps rows whose cleaned text is at least this long.
+CLEAN_TEXT_COLUMN = "clean_body"
+CLEAN_MIN_BODY_LEN = 25
+
+# created_utc-ordered projection added by torrent/time_projection.py. When enabled,
+# date-range queries without a subreddit are pointed at it, since the tables' own
+# (subreddit, created_utc) order cannot narrow a date range across subreddits.
+TIME_PROJECTION = "by_created_utc"
+TIME_PROJECTION_ENABLED = os.getenv("CH_TIME_PROJECTION", "false").lower() == "true"
+
+# Keyset pages are ordered by (created_utc, row's own id). The comments table exposes
+# parent_id as `id`, which is not unique, so pages carry the real id under this name.
+KEYSET_ID_COLUMN = "row_id"
+
+# TTL (seconds) for ClickHouse's query cache when a caller opts in without giving one.
+DEFAULT_QUERY_CACHE_TTL = int(os.getenv("CH_QUERY_CACHE_TTL", 300))
+
+
+def option_tables(option):
+    """
+    Map the `option` request parameter to the Reddit tables it selects.
+    """
+    tables = [part.strip() for part in (option or "").split(",") if part.strip()]
+    if not tables or any(table not in DATASET_COLUMNS for table in tables):
+        return []
+    # Keep submissions first so combined results keep their historical column order.
+    return sorted(set(tables), key=list(DATASET_COLUMNS).index)
+
+
+def parse_columns(raw, default=DEFAULT_COLUMNS):
+    """
+    Parse ?columns=a,b,c into a list of dataset columns; None if any name is unknown.
+    """
+    if not raw or not raw.strip():
+        return list(default)
+    columns = []
+    for name in raw.split(","):
+        name = name.strip()
+        if name not in DEFAULT_COLUMNS:
+            return None
+        if name not in columns:
+            columns.append(name)
+    return columns
+
+
+def format_date(value):
+    """
+    Normalize an ISO date parameter to the 'YYYY-MM-DD HH:MM:SS' form ClickHouse parses.
+    """
+    if not value:
+        return value
+    return value.replace("T", " ").split(".")[0]
+
+
+def escape_like(value):
+    """
+    Escape LIKE wildcards so a search value matches literally.
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_tokens(value):
+    """
+    Split a word-mode search value into the lowercase tokens hasToken understands.
+    Only ASCII is lowercased, matching ClickHouse's lower().
+    """
+    lowered = "".join(c.lower() if c.isascii() else c for c in value)
+    return TOKEN_PATTERN.findall(lowered)[:MAX_SEARCH_TOKENS]
+
+
+def parse_sample(raw):
+    """
+    Parse ?sample= into ("rows", n) for a row count or ("fraction", f) for 0 < f < 1.
+    Returns None when no sample was asked for; raises ValueError when it is invalid.
+    """
+    if raw is None or not str(raw).strip():
+        return None
+    value = float(raw)
+    if 0 < value < 1:
+        return ("fraction", value)
+    if value >= 1 and value.is_integer():
+        return ("rows", int(value))
+    raise ValueError("sample must be a row count or a fraction between 0 and 1")
+
+
+def sample_hash(table):
+    """
+    Seeded hash of the table's own row id. Qualified with the table name because the
+    comments branch exposes parent_id under the alias `id`.
+    """
+    return f"cityHash64({{sample_seed:UInt64}}, {table}.id)"
+
+
+def select_list(table, columns, clean=False):
+    """
+    Build the SELECT list exposing `columns` under their dataset names for `table`.
+    With `clean`, selftext is the cleaned text instead of the raw column.
+    """
+    exprs = []
+    for name in columns:
+        expr = CLEAN_TEXT_COLUMN if clean and name == "selftext" else DATASET_COLUMNS[table][name]
+        exprs.append(name if expr == name else f"{expr} AS {name}")
+    return ", ".join(exprs)
+
+
+def where_clause(table, subreddit="", start_date=None, end_date=None, search_value="",
+                 search_mode="substring", cursor=None, exclude_automoderator=True,
+                 sample=None, sample_seed=DEFAULT_SAMPLE_SEED, clean=False):
+    """
+    Conditions for one table, written against its own columns so ClickHouse can use
+    the (subreddit, created_utc) sort key. Returns (sql, parameters).
+    """
+    col = DATASET_COLUMNS[table]
+    conditions = []
+    parameters = {}
+    if subreddit:
+        conditions.append(f"{col['subreddit']} = {{subreddit:String}}")
+        parameters["subreddit"] = subreddit
+    if start_date:
+        conditions.append(f"{col['created_utc']} >= {{start_date:DateTime64(3)}}")
+        parameters["start_date"] = format_date(start_date)
+    if end_date:
+        conditions.append(f"{col['created_utc']} <= {{end_date:DateTime64(3)}}")
+        parameters["end_date"] = format_date(end_date)
+    # Search always reads the raw text; with clean=true `selftext` is the alias of
+    # clean_body, so the column is qualified to get past the alias.
+    text = f"{table}.{col['selftext']}" if clean else col['selftext']
+    tokens = search_tokens(search_value) if search_value and search_mode == "word" else []
+    if tokens:
+        # lower(...) must match the indexed expression for the skip index to apply.
+        for i, token in enumerate(tokens):
+            conditions.append(f"hasToken(lower({text}), {{search_token_{i}:String}})")
+            parameters[f"search_token_{i}"] = token
+    elif search_value:
+        conditions.append(f"{text} LIKE {{search_pattern:String}}")
+        parameters["search_pattern"] = f"%{escape_like(search_value)}%"
+    if cursor:
+        conditions.append(
+            f"({col['created_utc']}, {table}.id) < "
+            "(fromUnixTimestamp64Milli({cursor_ts:Int64}), {cursor_id:String})"
+        )
+        parameters["cursor_ts"], parameters["cursor_id"] = cursor
+    if exclude_automoderator:
+        # Filter out posts by AutoModerator.
+        conditions.append(f"{col['author']} != 'AutoModerator'")
+    if clean:
+        conditions.append(f"body_len >= {CLEAN_MIN_BODY_LEN}")
+    if sample:
+        parameters["sample_seed"] = int(sample_seed)
+        if sample[0] == "fraction":
+            conditions.append(f"{sample_hash(table)} % {SAMPLE_SCALE} < {{sample_threshold:UInt64}}")
+            parameters["sample_threshold"] = int(sample[1] * SAMPLE_SCALE)
+
+    if not conditions:
+        return "", parameters
+    return " WHERE " + " AND ".join(conditions), parameters
+
+
+def build_dataset_query(tables, columns, subreddit="", start_date=None, end_date=None,
+                        search_value="", search_mode="substring", cursor=None, page_size=None,
+                        exclude_automoderator=True, sample=None, sample_seed=DEFAULT_SAMPLE_SEED,
+                        clean=False):
+    """
+    Build the dataset query for one or both Reddit tables. Returns (sql, parameters).
+
+    Without page_size the result is ordered by created_utc DESC. With page_size it is
+    a keyset page ordered by (created_utc, row_id) DESC, starting after `cursor`, and
+    each row also carries its own id as KEYSET_ID_COLUMN for the next cursor.
+    `sample` (from parse_sample) keeps a deterministic subset of the matching rows;
+    a row-count sample cannot be combined with page_size. `clean` returns the cleaned
+    text as selftext and drops rows shorter than CLEAN_MIN_BODY_LEN.
+    """
+    filters = dict(
+        subreddit=subreddit,
+        start_date=start_date,
+        end_date=end_date,
+        search_value=search_value,
+        search_mode=search_mode,
+        cursor=cursor,
+        exclude_automoderator=exclude_automoderator,
+        sample=sample,
+        sample_seed=sample_seed,
+        clean=clean
+    )
+    if sample and sample[0] == "rows":
+        if page_size is not None:
+            raise ValueError("A row-count sample cannot be paged.")
+        return _sampled_rows_query(tables, columns, sample[1], filters)
+
+    if page_size is not None:
+        order_by = f" ORDER BY created_utc DESC, {KEYSET_ID_COLUMN} DESC"
+        limit = f" LIMIT {int(page_size)}"
+    else:
+        order_by = " ORDER BY created_utc DESC"
+        limit = ""
+
+    def keyset_id(table):
+        # Qualified for the same reason as sample_hash: `id` is parent_id for comments.
+        return f", {table}.id AS {KEYSET_ID_COLUMN}" if page_size is not None else ""
+
+    if len(tables) == 1:
+        table = tables[0]
+        where, parameters = where_clause(table, **filters)
+        sql = f"SELECT {select_list(table, columns, clean)}{keyset_id(table)} FROM {table}{where}{order_by}{limit}"
+        return sql, parameters
+
+    # Filter each table before the UNION ALL; a page only needs page_size rows from each side.
+    branch_columns = list(dict.fromkeys(columns + ["created_utc", "id"]))
+    branches = []
+    parameters = {}
+    for table in tables:
+        where, parameters = where_clause(table, **filters)
+        branch = f"SELECT {select_list(table, branch_columns, clean)}{keyset_id(table)} FROM {table}{where}"
+        if page_size is not None:
+            branch += f"{order_by}{limit}"
+        branches.append(f"({branch})")
+    outer_columns = columns + [KEYSET_ID_COLUMN] if page_size is not None else columns
+    sql = (
+        f"SELECT {', '.join(outer_columns)} FROM ("
+        + " UNION ALL ".join(branches)
+        + f") AS combined{order_by}{limit}"
+    )
+    return sql, parameters
+
+
+def build_table_queries(tables, columns, ordered=True, **filters):
+    """
+    One query per table for a multi-table dataset, each returning `columns` plus
+    created_utc and, when `ordered`, sorted by created_utc DESC so the streams can be
+    merged (see merge.py). Returns [(sql, parameters)]. Takes the same filters as
+    build_dataset_query except paging and row-count samples.
+    """
+    branch_columns = list(dict.fromkeys(columns + ["created_utc"]))
+    order_by = " ORDER BY created_utc DESC" if ordered else ""
+    queries = []
+    for table in tables:
+        where, parameters = where_clause(table, **filters)
+        queries.append((
+            f"SELECT {select_list(table, branch_columns, filters.get('clean', False))} "
+            f"FROM {table}{where}{order_by}",
+            parameters
+        ))
+    return queries
+
+
+def build_volume_query(tables, subreddit="", start_ms=None, end_ms=None, bin_size="day"):
+    """
+    Posting volume from reddit_daily_volume, binned by `bin_size`. Each row is
+    (bin start in epoch milliseconds, posts, unique authors). Returns (sql, parameters).
+    """
+    conditions = ["type IN {types:Array(String)}"]
+    parameters = {"types": [VOLUME_TYPES[table] for table in tables]}
+    if subreddit:
+        conditions.append("subreddit = {subreddit:String}")
+        parameters["subreddit"] = subreddit
+    if start_ms is not None:
+        conditions.append("day >= toDate(fromUnixTimestamp64Milli({start_ms:Int64}, 'UTC'))")
+        parameters["start_ms"] = int(start_ms)
+    if end_ms is not None:
+        conditions.append("day <= toDate(fromUnixTimestamp64Milli({end_ms:Int64}, 'UTC'))")
+        parameters["end_ms"] = int(end_ms)
+    sql = (
+        f"SELECT toUnixTimestamp(toDateTime({VOLUME_BINS[bin_size]}, 'UTC')) * 1000 AS t, "
+        "sum(posts) AS posts, uniqMerge(authors) AS authors "
+        "FROM reddit_daily_volume WHERE " + " AND ".join(conditions) +
+        " GROUP BY t ORDER BY t"
+    )
+    return sql, parameters
+
+
+def projection_settings(subreddit="", start_date=None, end_date=None):
+    """
+    ClickHouse settings that route a cross-subreddit date-range query to the
+    time-ordered projection. Empty when it does not apply or is not enabled.
+    """
+    if not TIME_PROJECTION_ENABLED or subreddit or not (start_date or end_date):
+        return {}
+    return {"optimize_use_projections": 1, "preferred_optimize_projection_name": TIME_PROJECTION}
+
+
+def query_cache_settings(ttl=None):
+    """
+    ClickHouse settings that serve a repeated query from the server's query cache
+    for `ttl` seconds. Returns no settings when ttl is 0 or negative.
+    """
+    ttl = DEFAULT_QUERY_CACHE_TTL if ttl is None else int(ttl)
+    if ttl <= 0:
+        return {}
+    return {"use_query_cache": 1, "query_cache_ttl": ttl}
+
+
+def _sampled_rows_query(tables, columns, rows, filters):
+    """
+    Keep the `rows` matching rows with the smallest seeded hash, then restore the
+    usual created_utc DESC order. Each table contributes at most `rows` candidates.
+    """
+    branch_columns = list(dict.fromkeys(columns + ["created_utc"]))
+    branches = []
+    parameters = {}
+    for table in tables:
+        where, parameters = where_clause(table, **filters)
+        branches.append(
+            f"(SELECT {select_list(table, branch_columns, filters['clean'])}, {sample_hash(table)} AS sample_key "
+            f"FROM {table}{where} ORDER BY sample_key LIMIT {int(rows)})"
+        )
+    sql = (
+        f"SELECT {', '.join(columns)} FROM ("
+        "SELECT * FROM (" + " UNION ALL ".join(branches) + ") "
+        f"ORDER BY sample_key LIMIT {int(rows)}"
+        ") AS sampled ORDER BY created_utc DESC"
+    )
+    return sql, parameters
+
+
+def build_count_query(tables, subreddit="", start_date=None, end_date=None, search_value="",
+                      search_mode="substring", exclude_automoderator=True, clean=False):
+    """
+    Count the rows a dataset query would match before sampling. Returns (sql, parameters).
+    """
+    counts = []
+    parameters = {}
+    for table in tables:
+        where, parameters = where_clause(
+            table,
+            subreddit=subreddit,
+            start_date=start_date,
+            end_date=end_date,
+            search_value=search_value,
+            search_mode=search_mode,
+            exclude_automoderator=exclude_automoderator,
+            clean=clean
+        )
+        counts.append(f"(SELECT count() FROM {table}{where})")
+    return "SELECT " + " + ".join(counts) + " AS population", parameters
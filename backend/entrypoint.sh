@@ -18,4 +18,4 @@ done
 python -u create_tables.py
 
 echo "Starting Flask server..."
-exec gunicorn --workers=4 --bind=0.0.0.0:5000 "app:create_app()"
+exec gunicorn -c gunicorn.conf.py --workers=4 --bind=0.0.0.0:5000 "app:create_app()"
@@ -0,0 +1,19 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+# Each worker writes its metric samples here and /metrics merges them, so a scrape
+# sees all workers no matter which one answers it. Must be set before the app imports
+# prometheus_client, which is why it lives in the gunicorn config.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/ocss_prometheus")
+
+
+def on_starting(server):
+    # Samples left over from a previous run would be merged into the new one.
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
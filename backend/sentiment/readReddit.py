@@ -5,6 +5,10 @@ import requests
 import io
 import pyarrow as pa
 from nli_aspect import run_nli_aspect_analysis
+from common.ch_data import load_dataset
+
+# Load datasets from ClickHouse directly rather than through /api/get_arrow.
+CH_DIRECT_LOAD = os.getenv("CH_DIRECT_LOAD", "true").lower() == "true"
 
 def load_dataframe(meta):
     # Get API parameters from meta
@@ -12,33 +16,58 @@ def load_dataframe(meta):
     option = meta["option"]
     startDate = meta.get("startDate", "")
     endDate = meta.get("endDate", "")
-    # Build the API URL and append date parameters if provided.
+    sample = meta.get("sample", "")
     print('fetching from clickhouse')
 
-    ch_host = os.getenv("CH_HOST", "localhost")
-    api_url = f"https://{ch_host}/api/get_arrow?subreddit={subreddit}&option={option}"
-    if startDate:
-        api_url += f"&startDate={startDate}"
-    if endDate:
-        api_url += f"&endDate={endDate}"
-    try:
-        response = requests.get(api_url, verify=False)
-        response.raise_for_status()
-        # Read the binary Arrow stream.
-        buffer = io.BytesIO(response.content)
-        reader = pa.ipc.open_stream(buffer)
-        table = reader.read_all()
-
-        # Optionally, convert the Arrow Table to a pandas DataFrame if needed.
-        df = table.to_pandas()
-        # Print the first 5 records from the "data" key.
-        # print(data["data"][0:5])
-        # Iterate over the actual records list.
-        # for record in data["data"]:
-            # print(record[-1])
-
-    except Exception as e:
-        raise Exception(f"Error fetching data from API: {e}")
+    if CH_DIRECT_LOAD:
+        # Read straight from ClickHouse (common/ch_data.py), bypassing the web tier.
+        try:
+            table, _ = load_dataset(
+                subreddit,
+                option,
+                startDate,
+                endDate,
+                sample=sample,
+                sample_seed=meta.get('sample_seed', 0)
+            )
+            df = table.to_pandas(split_blocks=True, self_destruct=True)
+            del table
+        except Exception as e:
+            raise Exception(f"Error fetching data from ClickHouse: {e}")
+    else:
+        # Build the API URL and append date parameters if provided.
+        ch_host = os.getenv("CH_HOST", "localhost")
+        api_url = f"https://{ch_host}/api/get_arrow?subreddit={subreddit}&option={option}&compression=zstd"
+        if startDate:
+            api_url += f"&startDate={startDate}"
+        if endDate:
+            api_url += f"&endDate={endDate}"
+        if sample:
+            # Reuse the topic job's sample so sentiment sees the same rows.
+            api_url += f"&sample={sample}&sample_seed={meta.get('sample_seed', 0)}"
+        try:
+            response = requests.get(api_url, verify=False)
+            response.raise_for_status()
+            # Read the binary Arrow stream.
+            buffer = io.BytesIO(response.content)
+            reader = pa.ipc.open_stream(buffer)
+            table = reader.read_all()
+            # LowCardinality columns arrive dictionary-encoded; decode them to plain strings.
+            table = pa.Table.from_arrays(
+                [col.cast(col.type.value_type) if pa.types.is_dictionary(col.type) else col for col in table.columns],
+                names=table.column_names
+            )
+
+            # Optionally, convert the Arrow Table to a pandas DataFrame if needed.
+            df = table.to_pandas()
+            # Print the first 5 records from the "data" key.
+            # print(data["data"][0:5])
+            # Iterate over the actual records list.
+            # for record in data["data"]:
+                # print(record[-1])
+
+        except Exception as e:
+            raise Exception(f"Error fetching data from API: {e}")
 
     print('done fetching from clickhouse')
    
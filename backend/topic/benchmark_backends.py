@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Compare the topic backends (cluster_backends.py) on synthetic corpora: normalized
+# Gaussian blobs shaped like sentence embeddings, so no model or database is needed.
+#
+#   python benchmark_backends.py --sizes 10000,50000 --backends cuml,cpu:umap,cpu:pca+umap
+import argparse
+import time
+
+import numpy as np
+from sklearn.datasets import make_blobs
+from sklearn.metrics import adjusted_rand_score
+
+from cluster_backends import CpuBackend, get_backend
+from topic_model import config
+
+
+def synthetic_corpus(n_docs, n_topics, dim, seed):
+    """
+    Unit-length vectors around `n_topics` centres, plus the true topic of each.
+    """
+    embeddings, labels = make_blobs(n_samples=n_docs, n_features=dim, centers=n_topics,
+                                    cluster_std=4.0, random_state=seed)
+    embeddings = embeddings.astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings, labels
+
+
+def make_backend(spec):
+    # "cpu:<reduction>" selects a CPU reduction; anything else is a TOPIC_BACKEND name.
+    if spec.startswith("cpu:"):
+        return CpuBackend(reduction=spec.split(":", 1)[1])
+    return get_backend(spec)
+
+
+def run(spec, embeddings, labels):
+    backend = make_backend(spec)
+    start = time.time()
+    reduced = backend.reducer(**config['topic_umap_params']).fit_transform(embeddings)
+    reduce_seconds = time.time() - start
+
+    start = time.time()
+    clusters = np.asarray(backend.hdbscan(**config['topic_hdbscan_params']).fit_predict(reduced))
+    cluster_seconds = time.time() - start
+
+    found = clusters >= 0
+    return {
+        "reduce": reduce_seconds,
+        "cluster": cluster_seconds,
+        "topics": len(np.unique(clusters[found])),
+        "noise": 1 - found.mean(),
+        # Agreement with the true topics over the documents that were clustered.
+        "ari": adjusted_rand_score(labels[found], clusters[found]) if found.any() else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark topic reduction/clustering backends on synthetic embeddings.")
+    parser.add_argument("--sizes", default="10000,50000", help="comma-separated document counts")
+    parser.add_argument("--backends", default="cuml,cpu:umap,cpu:pca+umap,cpu:pca",
+                        help="comma-separated backends: cuml, cpu or cpu:<reduction>")
+    parser.add_argument("--topics", type=int, default=40)
+    parser.add_argument("--dim", type=int, default=768, help="embedding width (bge-base is 768)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'backend':<16}{'docs':>10}{'reduce s':>10}{'cluster s':>11}{'total s':>9}{'topics':>8}{'noise':>8}{'ARI':>7}")
+    for n_docs in (int(size) for size in args.sizes.split(",")):
+        embeddings, labels = synthetic_corpus(n_docs, args.topics, args.dim, args.seed)
+        for spec in args.backends.split(","):
+            try:
+                result = run(spec, embeddings, labels)
+            except Exception as e:
+                print(f"{spec:<16}{n_docs:>10,}  skipped: {e}")
+                continue
+            print(f"{spec:<16}{n_docs:>10,}{result['reduce']:>10.1f}{result['cluster']:>11.1f}"
+                  f"{result['reduce'] + result['cluster']:>9.1f}{result['topics']:>8}"
+                  f"{result['noise']:>8.1%}{result['ari']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+
+# Dimensionality reduction and clustering for the topic pipeline. "cuml" runs UMAP and
+# HDBSCAN on the GPU; "cpu" uses umap-learn and the hdbscan package so topic workers
+# can also run on nodes without a GPU. "auto" picks cuml when it can be imported.
+TOPIC_BACKEND = os.getenv("TOPIC_BACKEND", "auto")
+# CPU reduction: "umap", "pca+umap" (PCA down to TOPIC_CPU_PCA_COMPONENTS first, which
+# makes UMAP's nearest-neighbour search much cheaper on 768-d embeddings), or "pca" alone.
+TOPIC_CPU_REDUCTION = os.getenv("TOPIC_CPU_REDUCTION", "umap")
+TOPIC_CPU_PCA_COMPONENTS = int(os.getenv("TOPIC_CPU_PCA_COMPONENTS", 50))
+# Threads for umap-learn's nearest-neighbour descent and hdbscan's core distances
+# (-1 = all cores).
+TOPIC_CPU_JOBS = int(os.getenv("TOPIC_CPU_JOBS", -1))
+# umap-learn runs single-threaded whenever random_state is set. The topic UMAP keeps it
+# by default, since the KMeans groups are computed on the same reduction BERTopic fits
+# and an unseeded refit would not line up with them. Set to false to drop random_state
+# for parallel nearest-neighbour descent when reproducibility does not matter.
+TOPIC_CPU_DETERMINISTIC = os.getenv("TOPIC_CPU_DETERMINISTIC", "true").lower() == "true"
+
+CPU_REDUCTIONS = ("umap", "pca+umap", "pca")
+
+
+class CumlBackend:
+    name = "cuml"
+
+    def __init__(self):
+        from cuml.cluster import HDBSCAN
+        from cuml.manifold import UMAP
+        self._umap = UMAP
+        self._hdbscan = HDBSCAN
+
+    def reducer(self, **params):
+        return self._umap(**params)
+
+    def umap(self, parallel=False, **params):
+        return self._umap(**params)
+
+    def hdbscan(self, **params):
+        return self._hdbscan(**params)
+
+
+class CpuBackend:
+    name = "cpu"
+
+    def __init__(self, reduction=TOPIC_CPU_REDUCTION, pca_components=TOPIC_CPU_PCA_COMPONENTS,
+                 n_jobs=TOPIC_CPU_JOBS, deterministic=TOPIC_CPU_DETERMINISTIC):
+        if reduction not in CPU_REDUCTIONS:
+            raise ValueError(f"TOPIC_CPU_REDUCTION must be one of {', '.join(CPU_REDUCTIONS)}")
+        from hdbscan import HDBSCAN
+        from umap import UMAP
+        self._umap = UMAP
+        self._hdbscan = HDBSCAN
+        self.reduction = reduction
+        self.pca_components = pca_components
+        self.n_jobs = n_jobs
+        self.deterministic = deterministic
+
+    def reducer(self, **params):
+        """
+        Reducer for the document embeddings, built from the topic UMAP parameters. It
+        has fit/fit_transform/transform, so BERTopic can use it as its umap_model.
+        """
+        from sklearn.decomposition import PCA
+        from sklearn.pipeline import make_pipeline
+
+        if self.reduction == "pca":
+            return PCA(n_components=params["n_components"], random_state=params.get("random_state"))
+        params = dict(params)
+        if not self.deterministic:
+            params.pop("random_state", None)
+        umap_model = self._umap(n_jobs=self.n_jobs, low_memory=True, **params)
+        if self.reduction == "pca+umap":
+            return make_pipeline(PCA(n_components=self.pca_components, random_state=0), umap_model)
+        return umap_model
+
+    def umap(self, parallel=False, **params):
+        """
+        UMAP for the smaller reductions (topic groups, plots). They keep random_state so
+        they stay reproducible unless `parallel` asks for a multi-threaded run over the
+        documents.
+        """
+        if parallel and not self.deterministic:
+            params.pop("random_state", None)
+            return self._umap(n_jobs=self.n_jobs, low_memory=True, **params)
+        return self._umap(**params)
+
+    def hdbscan(self, **params):
+        # prediction_data (set in topic_hdbscan_params) keeps approximate_predict available.
+        return self._hdbscan(core_dist_n_jobs=self.n_jobs, **params)
+
+
+BACKENDS = {"cuml": CumlBackend, "cpu": CpuBackend}
+
+
+def get_backend(name=TOPIC_BACKEND):
+    """
+    Instantiate the backend called `name`; "auto" falls back to cpu when cuML is missing.
+    """
+    if name == "auto":
+        try:
+            return CumlBackend()
+        except Exception as e:
+            print(f"cuML is not available ({e}); using the CPU topic backend.", flush=True)
+            return CpuBackend()
+    if name not in BACKENDS:
+        raise ValueError(f"TOPIC_BACKEND must be one of auto, {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
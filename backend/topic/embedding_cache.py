@@ -0,0 +1,222 @@
+import os
+import re
+import time
+import fcntl
+import hashlib
+
+import numpy as np
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.path.expanduser(os.getenv("EMBEDDING_CACHE_DIR", "~/.cache/ocss_embeddings"))
+# Segments are merged into one once there are more than this many.
+EMBEDDING_CACHE_MAX_SEGMENTS = int(os.getenv("EMBEDDING_CACHE_MAX_SEGMENTS", 16))
+# Vectors kept per model when segments are merged; the oldest written are dropped past
+# it (about 3 KB each at 768 dimensions). 0 keeps everything.
+EMBEDDING_CACHE_MAX_VECTORS = int(os.getenv("EMBEDDING_CACHE_MAX_VECTORS", 2_000_000))
+
+KEYS_SUFFIX = ".keys.npy"
+VECTORS_SUFFIX = ".vectors.npy"
+# Files are written under this suffix and renamed into place, so a writer that dies
+# halfway never leaves anything _segments() would list.
+TMP_SUFFIX = ".tmp"
+
+
+def embedding_keys(ids, texts):
+    """
+    64-bit key per document from its post id and a hash of its text, so an edited
+    post is embedded again.
+    """
+    keys = np.empty(len(texts), dtype=np.uint64)
+    for i, (post_id, text) in enumerate(zip(ids, texts)):
+        digest = hashlib.blake2b(f"{post_id}\0{text}".encode("utf-8"), digest_size=8).digest()
+        keys[i] = int.from_bytes(digest, "little")
+    return keys
+
+
+class EmbeddingCache:
+    """
+    Embeddings for one model, stored on disk as append-only segments: a .keys.npy of
+    uint64 keys and a .vectors.npy float32 matrix read back with mmap. Opening the
+    cache only loads the keys into one sorted index, so bulk lookups are a
+    searchsorted plus a gather from the memory-mapped vectors.
+    """
+
+    def __init__(self, model_name, dim, root=EMBEDDING_CACHE_DIR):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.dim = dim
+        self.path = os.path.join(root, f"{slug}-{dim}")
+        os.makedirs(self.path, exist_ok=True)
+        self._load_index()
+
+    def _lock(self, shared=False):
+        fh = open(os.path.join(self.path, ".lock"), "w")
+        fcntl.flock(fh, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return fh
+
+    def _segments(self):
+        # A segment exists once its keys file does; vectors are always written first.
+        return sorted(name[:-len(KEYS_SUFFIX)] for name in os.listdir(self.path) if name.endswith(KEYS_SUFFIX))
+
+    def _load_index(self):
+        # Shared lock: a compaction in another process must not delete segments
+        # between listing and loading them.
+        with self._lock(shared=True):
+            self._read_index()
+
+    def _read_index(self):
+        self._vectors = []
+        keys, segment_ids, rows = [], [], []
+        for segment in self._segments():
+            try:
+                segment_vectors = np.load(os.path.join(self.path, segment + VECTORS_SUFFIX), mmap_mode="r")
+            except FileNotFoundError:
+                # Left by an older writer that crashed; the next compaction removes it.
+                print(f"Embedding cache: skipping segment {segment} without vectors", flush=True)
+                continue
+            segment_keys = np.load(os.path.join(self.path, segment + KEYS_SUFFIX))
+            n = len(self._vectors)
+            self._vectors.append(segment_vectors)
+            keys.append(segment_keys)
+            segment_ids.append(np.full(len(segment_keys), n, dtype=np.int32))
+            rows.append(np.arange(len(segment_keys), dtype=np.int64))
+        if keys:
+            keys = np.concatenate(keys)
+            order = np.argsort(keys, kind="stable")
+            self._keys = keys[order]
+            self._segment_ids = np.concatenate(segment_ids)[order]
+            self._rows = np.concatenate(rows)[order]
+        else:
+            self._keys = np.empty(0, dtype=np.uint64)
+            self._segment_ids = np.empty(0, dtype=np.int32)
+            self._rows = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, keys):
+        """
+        Return (vectors, missing): a float32 (len(keys), dim) matrix filled for every
+        cached key, and the positions of the keys that still need embedding. A key
+        cached more than once is read from its newest segment.
+        """
+        vectors = np.zeros((len(keys), self.dim), dtype=np.float32)
+        if not len(self._keys):
+            return vectors, np.arange(len(keys))
+        pos = np.searchsorted(self._keys, keys, side="right") - 1
+        pos = np.maximum(pos, 0)
+        found = self._keys[pos] == keys
+        for n, segment_vectors in enumerate(self._vectors):
+            in_segment = found & (self._segment_ids[pos] == n)
+            if in_segment.any():
+                vectors[in_segment] = segment_vectors[self._rows[pos[in_segment]]]
+        return vectors, np.flatnonzero(~found)
+
+    def add(self, keys, vectors):
+        """
+        Persist newly computed embeddings as a new segment and add them to the index.
+        """
+        if not len(keys):
+            return
+        keys, unique = np.unique(keys, return_index=True)
+        vectors = np.asarray(vectors, dtype=np.float32)[unique]
+        segment = f"{time.time_ns():020d}-{os.getpid()}"
+        with self._lock():
+            self._save(segment + VECTORS_SUFFIX, vectors)
+            self._save(segment + KEYS_SUFFIX, keys)
+            if len(self._segments()) > EMBEDDING_CACHE_MAX_SEGMENTS:
+                self._compact()
+        self._load_index()
+
+    def _save(self, name, data):
+        tmp_path = os.path.join(self.path, name + TMP_SUFFIX)
+        # np.save only appends ".npy" to paths, not to open files.
+        with open(tmp_path, "wb") as fh:
+            np.save(fh, data)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def _compact(self):
+        """
+        Merge every segment into one, keeping the newest vector for each key and at
+        most EMBEDDING_CACHE_MAX_VECTORS of them, oldest dropped first. Also removes
+        what crashed writers left behind. Called with the lock held.
+        """
+        segments = self._segments()
+        self._read_index()
+        # Segments are read oldest first and the key sort is stable, so the newest copy
+        # of a key is the last of its run.
+        last = np.flatnonzero(np.append(self._keys[1:] != self._keys[:-1], True))
+        if EMBEDDING_CACHE_MAX_VECTORS and len(last) > EMBEDDING_CACHE_MAX_VECTORS:
+            newest = np.argsort(self._segment_ids[last], kind="stable")[-EMBEDDING_CACHE_MAX_VECTORS:]
+            last = np.sort(last[newest])
+        keys = self._keys[last]
+        segment = f"{time.time_ns():020d}-{os.getpid()}"
+        tmp_path = os.path.join(self.path, segment + VECTORS_SUFFIX + TMP_SUFFIX)
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(keys), self.dim))
+        for n, segment_vectors in enumerate(self._vectors):
+            in_segment = self._segment_ids[last] == n
+            out[np.flatnonzero(in_segment)] = segment_vectors[self._rows[last][in_segment]]
+        out.flush()
+        del out
+        os.replace(tmp_path, os.path.join(self.path, segment + VECTORS_SUFFIX))
+        self._save(segment + KEYS_SUFFIX, keys)
+        stale = [old + suffix for old in segments for suffix in (KEYS_SUFFIX, VECTORS_SUFFIX)]
+        # Every writer holds the lock, so temporary files seen here belong to dead ones.
+        stale += [name for name in os.listdir(self.path) if name.endswith(TMP_SUFFIX)]
+        for name in stale:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+
+class CachedEncoder:
+    """
+    Encodes texts in successive chunks with `model`, reusing vectors cached for the
+    same (id, text, model) and encoding only the misses. New vectors are written to
+    the cache in one segment by flush().
+    """
+
+    def __init__(self, model, model_name, batch_size=64, show_progress_bar=True):
+        self.model = model
+        self.batch_size = batch_size
+        self.show_progress_bar = show_progress_bar
+        self.cache = EmbeddingCache(model_name, model.get_sentence_embedding_dimension()) if EMBEDDING_CACHE_ENABLED else None
+        self.hits = 0
+        self._new_keys = []
+        self._new_vectors = []
+
+    def _encode(self, texts):
+        return self.model.encode(texts, show_progress_bar=self.show_progress_bar, batch_size=self.batch_size)
+
+    def encode(self, ids, texts):
+        if self.cache is None:
+            return self._encode(texts)
+        keys = embedding_keys(ids, texts)
+        vectors, missing = self.cache.lookup(keys)
+        self.hits += len(texts) - len(missing)
+        if len(missing):
+            encoded = self._encode([texts[i] for i in missing])
+            vectors[missing] = encoded
+            self._new_keys.append(keys[missing])
+            self._new_vectors.append(encoded)
+        return vectors
+
+    def flush(self):
+        if self.cache is None:
+            return
+        misses = sum(len(keys) for keys in self._new_keys)
+        print(f"Embedding cache: {self.hits:,} hits, {misses:,} encoded", flush=True)
+        if self._new_keys:
+            self.cache.add(np.concatenate(self._new_keys), np.concatenate(self._new_vectors))
+        self.hits = 0
+        self._new_keys, self._new_vectors = [], []
+
+
+def encode_with_cache(model, model_name, ids, texts, batch_size=64):
+    """
+    Embed `texts` with `model` in one go through a CachedEncoder.
+    """
+    encoder = CachedEncoder(model, model_name, batch_size=batch_size)
+    vectors = encoder.encode(ids, texts)
+    encoder.flush()
+    return vectors
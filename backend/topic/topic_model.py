@@ -12,6 +12,9 @@ import pickle
 import time
 import pyarrow as pa
 import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
 from bertopic import BERTopic
@@ -19,17 +22,16 @@ from bertopic.representation import KeyBERTInspired, MaximalMarginalRelevance
 from langchain.llms import Ollama
 
 from sentence_transformers import SentenceTransformer
+from embedding_cache import CachedEncoder, encode_with_cache
+from common.ch_data import load_dataset, open_dataset
 
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.preprocessing import MinMaxScaler as mms
 from sklearn.cluster import KMeans, SpectralClustering
-# from hdbscan import HDBSCAN
 from sklearn.metrics.pairwise import cosine_similarity, cosine_distances
 from sklearn.metrics import silhouette_score, davies_bouldin_score
 
-# from umap import UMAP
-from cuml.cluster import HDBSCAN
-from cuml.manifold import UMAP
+from cluster_backends import TOPIC_BACKEND, get_backend
 
 import requests
 
@@ -55,6 +57,43 @@ def _normalize_ollama_base(url: str) -> str:
 
 OLLAMA_IP = _normalize_ollama_base(os.getenv("OLLAMA_IP_ADDRESS", "http://localhost:11434"))
 
+# Ask get_arrow for the text cleaned at ingestion (clean=true) instead of cleaning it in
+# pandas. Off by default: only enable it once the tables have clean_body
+# (see torrent/clean_body.py), since queries against tables without it fail.
+SERVER_SIDE_CLEAN = os.getenv("SERVER_SIDE_CLEAN", "false").lower() == "true"
+# Load datasets from ClickHouse directly (CH_HOST/CH_PORT/CH_USER/...) rather than
+# through the public /api/get_arrow endpoint.
+CH_DIRECT_LOAD = os.getenv("CH_DIRECT_LOAD", "true").lower() == "true"
+# With direct loading, clean and embed each chunk of rows while the rest is still
+# downloading, instead of fetching everything before encoding starts.
+STREAM_EMBEDDINGS = os.getenv("STREAM_EMBEDDINGS", "true").lower() == "true"
+# Rows handed to the encoder at a time, and cleaned chunks the fetch thread may read ahead.
+ENCODE_CHUNK_ROWS = int(os.getenv("ENCODE_CHUNK_ROWS", 8192))
+PREFETCH_CHUNKS = int(os.getenv("PREFETCH_CHUNKS", 4))
+# Labeling prompts sent to Ollama at once. Ollama only runs them side by side up to its
+# own OLLAMA_NUM_PARALLEL; beyond that they queue on the server.
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", 4))
+
+
+def predict_concurrently(llm, prompts, max_in_flight=LLM_MAX_IN_FLIGHT):
+    """
+    Send each prompt of {key: prompt} to `llm` from a thread pool, at most
+    `max_in_flight` at a time, and yield (key, response, seconds) as each one finishes.
+    Prompts not yet sent are cancelled if the caller stops early or a prediction fails.
+    """
+    def predict(key, prompt):
+        start_time = time.time()
+        response = llm.predict(prompt)
+        return key, response, time.time() - start_time
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight))
+    try:
+        futures = [executor.submit(predict, key, prompt) for key, prompt in prompts.items()]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
 # Updated configuration
 config = {
     # Set data_source to "api" to indicate that data should be fetched via HTTP
@@ -62,11 +101,18 @@ config = {
     # For API queries, specify the subreddit and option (submissions or comments)
     'subreddit': 'survivor',  # adjust as needed
     'option': 'reddit_submissions',  # or "reddit_comments"
+    # Optional deterministic sample of the rows: a row count (e.g. 50000) or a fraction (e.g. 0.1).
+    # The same sample and seed always select the same rows.
+    'sample': '',
+    'sample_seed': 0,
     
     'embeddings': {
         'name': 'BAAI/bge-base-en-v1.5',
-        'device': 'cuda'
+        # None lets sentence-transformers use CUDA when it is available, else the CPU.
+        'device': os.getenv("EMBEDDING_DEVICE") or None
     },
+    # UMAP/HDBSCAN implementation: "cuml" (GPU), "cpu" or "auto"; see cluster_backends.py.
+    'backend': TOPIC_BACKEND,
     'save_dir': "saved",
     'random_state': 42,
     'topic_hdbscan_params': {
@@ -104,6 +150,11 @@ class TopicModeling():
 
     def __init__(self, config=config):
         self.config = config
+        self.population = None
+        self.embeddings = None
+        self.embedding_model = None
+        self.backend = get_backend(self.config.get('backend', TOPIC_BACKEND))
+        print(f"Topic backend: {self.backend.name}", flush=True)
 
     def _get_save_dir(self):
         save_dir = self.config.get('save_dir', 'saved')
@@ -111,8 +162,12 @@ class TopicModeling():
         return save_dir
 
     def run(self):
-        self.publish_progress("load_data_frame", "Fetching data from ClickHouse", 1/7)
-        self.load_data_frame()
+        if self._streams_embeddings():
+            self.publish_progress("load_data_frame", "Fetching and embedding data from ClickHouse", 1/7)
+            self.load_and_embed()
+        else:
+            self.publish_progress("load_data_frame", "Fetching data from ClickHouse", 1/7)
+            self.load_data_frame()
 
         self.publish_progress("find_topics", "Finding topic clusters", 2/7)
         self.find_topics()
@@ -145,33 +200,63 @@ class TopicModeling():
             option = self.config.get("option", "reddit_submissions")
             start_date = self.config.get("startDate", "")
             end_date = self.config.get("endDate", "")
-            # Build the API URL and append date parameters if provided.
+            sample = self.config.get("sample", "")
             print('fetching from clickhouse')
 
-            ch_host = os.getenv("CH_HOST", "localhost")
-            api_url = f"https://{ch_host}/api/get_arrow?subreddit={subreddit}&option={option}"
-            if start_date:
-                api_url += f"&startDate={start_date}"
-            if end_date:
-                api_url += f"&endDate={end_date}"
-            try:
-                response = requests.get(api_url, verify=False)
-                response.raise_for_status()
-                # Read the binary Arrow stream.
-                buffer = io.BytesIO(response.content)
-                reader = pa.ipc.open_stream(buffer)
-                table = reader.read_all()
-
-                # Optionally, convert the Arrow Table to a pandas DataFrame if needed.
-                df = table.to_pandas()
-                # Print the first 5 records from the "data" key.
-                # print(data["data"][0:5])
-                # Iterate over the actual records list.
-                # for record in data["data"]:
-                    # print(record[-1])
+            if CH_DIRECT_LOAD:
+                # Read straight from ClickHouse (common/ch_data.py), bypassing the web tier.
+                try:
+                    table, self.population = load_dataset(
+                        subreddit,
+                        option,
+                        start_date,
+                        end_date,
+                        sample=sample,
+                        sample_seed=self.config.get('sample_seed', 0),
+                        clean=SERVER_SIDE_CLEAN
+                    )
+                    df = table.to_pandas(split_blocks=True, self_destruct=True)
+                    del table
+                except Exception as e:
+                    raise Exception(f"Error fetching data from ClickHouse: {e}")
+            else:
+                # Build the API URL and append date parameters if provided.
+                ch_host = os.getenv("CH_HOST", "localhost")
+                api_url = f"https://{ch_host}/api/get_arrow?subreddit={subreddit}&option={option}&compression=zstd"
+                if start_date:
+                    api_url += f"&startDate={start_date}"
+                if end_date:
+                    api_url += f"&endDate={end_date}"
+                if sample:
+                    api_url += f"&sample={sample}&sample_seed={self.config.get('sample_seed', 0)}"
+                if SERVER_SIDE_CLEAN:
+                    api_url += "&clean=true"
+                try:
+                    response = requests.get(api_url, verify=False)
+                    response.raise_for_status()
+                    # Rows matching the filters before sampling (only sent for sampled requests).
+                    population = response.headers.get("X-Sample-Population")
+                    self.population = int(population) if population else None
+                    # Read the binary Arrow stream.
+                    buffer = io.BytesIO(response.content)
+                    reader = pa.ipc.open_stream(buffer)
+                    table = reader.read_all()
+                    # LowCardinality columns arrive dictionary-encoded; decode them to plain strings.
+                    table = pa.Table.from_arrays(
+                        [col.cast(col.type.value_type) if pa.types.is_dictionary(col.type) else col for col in table.columns],
+                        names=table.column_names
+                    )
+
+                    # Optionally, convert the Arrow Table to a pandas DataFrame if needed.
+                    df = table.to_pandas()
+                    # Print the first 5 records from the "data" key.
+                    # print(data["data"][0:5])
+                    # Iterate over the actual records list.
+                    # for record in data["data"]:
+                        # print(record[-1])
 
-            except Exception as e:
-                raise Exception(f"Error fetching data from API: {e}")
+                except Exception as e:
+                    raise Exception(f"Error fetching data from API: {e}")
 
             print('done fetching from clickhouse')
             
@@ -217,7 +302,12 @@ class TopicModeling():
             # print('!')
             print(df.head().to_string()[:2000])
             # print(":__)")
-            self.df = self.preprocess_dataframe(df)
+            if SERVER_SIDE_CLEAN:
+                # ClickHouse already cleaned the text and dropped short rows.
+                df['body_len'] = df['body'].str.len()
+                self.df = df
+            else:
+                self.df = self.preprocess_dataframe(df)
             self.texts = self.df['body'].tolist()
 
             print(self.df.to_string()[:2000])
@@ -235,6 +325,99 @@ class TopicModeling():
             self.texts = self.df['body'].tolist()
 
 
+    def _streams_embeddings(self):
+        return STREAM_EMBEDDINGS and CH_DIRECT_LOAD and self.config.get("data_source", "pickle") == "api"
+
+    def _fetch_chunks(self, batches, out, stop):
+        """
+        Fetch thread of load_and_embed(): turns each record batch into a cleaned frame
+        and queues it, blocking while PREFETCH_CHUNKS frames wait to be encoded.
+        """
+        def put(item):
+            while not stop.is_set():
+                try:
+                    out.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for batch in batches:
+                df = batch.to_pandas().rename(columns={"selftext": "body"})
+                if SERVER_SIDE_CLEAN:
+                    df['body_len'] = df['body'].str.len()
+                else:
+                    df = self.preprocess_dataframe(df)
+                if len(df) and not put(df):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+        finally:
+            batches.close()
+
+    def load_and_embed(self):
+        """
+        Streaming replacement for load_data_frame() plus the encoding step of
+        find_topics(): a thread downloads and cleans record batches into a bounded
+        queue while this thread embeds them ENCODE_CHUNK_ROWS at a time, so fetching
+        and encoding overlap.
+        """
+        print('fetching from clickhouse')
+        batches, self.population = open_dataset(
+            self.config.get("subreddit"),
+            self.config.get("option", "reddit_submissions"),
+            self.config.get("startDate", ""),
+            self.config.get("endDate", ""),
+            sample=self.config.get("sample", ""),
+            sample_seed=self.config.get('sample_seed', 0),
+            clean=SERVER_SIDE_CLEAN
+        )
+        self.embedding_model = SentenceTransformer(self.config['embeddings']['name'], device=self.config['embeddings']['device'])
+        encoder = CachedEncoder(self.embedding_model, self.config['embeddings']['name'], batch_size=64, show_progress_bar=False)
+
+        chunks = queue.Queue(maxsize=PREFETCH_CHUNKS)
+        stop = threading.Event()
+        fetcher = threading.Thread(target=self._fetch_chunks, args=(batches, chunks, stop), daemon=True)
+        fetcher.start()
+
+        frames, vectors, pending = [], [], []
+
+        def encode_pending():
+            df = pd.concat(pending, ignore_index=True)
+            vectors.append(encoder.encode(df['id'].tolist(), df['body'].tolist()))
+            frames.append(df)
+            pending.clear()
+            print(f"Embedded {sum(len(f) for f in frames):,} rows", flush=True)
+
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise Exception(f"Error fetching data from ClickHouse: {item}")
+                pending.append(item)
+                if sum(len(df) for df in pending) >= ENCODE_CHUNK_ROWS:
+                    encode_pending()
+            if pending:
+                encode_pending()
+        finally:
+            stop.set()
+        encoder.flush()
+        print('done fetching from clickhouse')
+
+        if frames:
+            self.df = pd.concat(frames, ignore_index=True)
+            self.embeddings = np.concatenate(vectors)
+        else:
+            self.df = pd.DataFrame(columns=["subreddit", "author", "title", "body", "created_utc", "id", "body_len"])
+            self.embeddings = np.empty((0, self.embedding_model.get_sentence_embedding_dimension()), dtype=np.float32)
+        self.texts = self.df['body'].tolist()
+        print('this many rows:')
+        print(len(self.df))
+
     @staticmethod
     def preprocess_dataframe(df):
         """
@@ -251,11 +434,17 @@ class TopicModeling():
 
     def find_topics(self):
         vectorizer_model = CountVectorizer(stop_words='english', ngram_range=(1, 2))
-        embedding_model = SentenceTransformer(self.config['embeddings']['name'], device=self.config['embeddings']['device'])
-        self.embeddings = embedding_model.encode(self.texts, show_progress_bar=True, batch_size=64)
-        umap_model = UMAP(**self.config['topic_umap_params'])
+        if self.embedding_model is None:
+            self.embedding_model = SentenceTransformer(self.config['embeddings']['name'], device=self.config['embeddings']['device'])
+        embedding_model = self.embedding_model
+        # load_and_embed() already encoded the texts while they were downloading.
+        if self.embeddings is None:
+            # Posts already embedded by this model in an earlier job are read back from the cache.
+            ids = self.df['id'].tolist() if 'id' in self.df else self.df.index.tolist()
+            self.embeddings = encode_with_cache(embedding_model, self.config['embeddings']['name'], ids, self.texts, batch_size=64)
+        umap_model = self.backend.reducer(**self.config['topic_umap_params'])
         u = umap_model.fit_transform(self.embeddings)
-        hdbscan_model = HDBSCAN(**self.config['topic_hdbscan_params'])
+        hdbscan_model = self.backend.hdbscan(**self.config['topic_hdbscan_params'])
         # After reducing the embeddings (u) using UMAP
         clusters = np.array(hdbscan_model.fit_predict(u))
 
@@ -364,7 +553,7 @@ class TopicModeling():
             self.c_tf_idf_vis = c_tf_idf_mms
         else:
             n_neighbors_vis = min(2, n_samples - 1) if n_samples > 1 else 1
-            self.c_tf_idf_vis = UMAP(
+            self.c_tf_idf_vis = self.backend.umap(
                 n_neighbors=n_neighbors_vis,
                 n_components=2,
                 metric='hellinger',
@@ -383,7 +572,7 @@ class TopicModeling():
             new_n_neighbors = max(2, min(self.config['group_umap_params']['n_neighbors'], n_samples - 1))
             self.config['group_umap_params']['n_neighbors'] = new_n_neighbors
 
-            self.c_tf_idf_embed = UMAP(**self.config['group_umap_params']).fit_transform(c_tf_idf_mms)
+            self.c_tf_idf_embed = self.backend.umap(**self.config['group_umap_params']).fit_transform(c_tf_idf_mms)
         
         # If there is only one sample, assign a default cluster without clustering.
         if n_samples < 2:
@@ -404,7 +593,7 @@ class TopicModeling():
 
 
     def label_groups(self):
-        self.group_labeler = GroupLabeling(self.df, self.topics, self.topic_labeler.topic_labels, self.groups, self.topic_model, self.topic_labeler, self.config)
+        self.group_labeler = GroupLabeling(self.df, self.topics, self.topic_labeler.topic_labels, self.groups, self.topic_model, self.topic_labeler, self.config, population=self.population)
 
 
 
@@ -482,7 +671,8 @@ class TopicModeling():
             vis_arr = np.array([[0.0, 0.0]])
         else:
             n_neighbors_vis = min(15, n_docs - 1)
-            vis_arr = UMAP(
+            vis_arr = self.backend.umap(
+                parallel=True,
                 n_neighbors=n_neighbors_vis,
                 n_components=2,
                 min_dist=0.1,
@@ -645,7 +835,11 @@ class TopicModeling():
             "subreddit": self.config.get("subreddit"),
             "option": self.config.get("option"),  # Indicates posts or comments.
             "startDate": self.config.get("startDate", ""),
-            "endDate": self.config.get("endDate", "")
+            "endDate": self.config.get("endDate", ""),
+            "sample": self.config.get("sample", ""),
+            "sample_seed": self.config.get("sample_seed", 0),
+            "sample_size": len(self.df),
+            "population": self.population if self.population is not None else len(self.df)
         }
         
         # Build the grouping results in a dictionary.
@@ -723,16 +917,15 @@ class TopicLabeling():
         
         total_time = 0
         total_topics = np.max(topics) + 1
-        print(f"Starting LLM predictions for {total_topics} topics...")
-        
-        for topic in tqdm(range(total_topics)):
-            prompt_i = self.prepare_prompt(topic_model, prompt_docs, topic)
-            start_time = time.time()
-            raw_response = self.llm.predict(prompt_i)
-            end_time = time.time()
-            elapsed_time = end_time - start_time
+        print(f"Starting LLM predictions for {total_topics} topics ({LLM_MAX_IN_FLIGHT} at a time)...")
+
+        prompts = {topic: self.prepare_prompt(topic_model, prompt_docs, topic) for topic in range(total_topics)}
+        wall_start = time.time()
+        # Topics finish in any order; `representations` is put back in topic order below.
+        predictions = predict_concurrently(self.llm, prompts)
+        for done, (topic, raw_response, elapsed_time) in enumerate(tqdm(predictions, total=total_topics), start=1):
             total_time += elapsed_time
-            
+
             message = f"Topic {topic} prediction: {elapsed_time:.2f} seconds"
             print(message)
 
@@ -741,7 +934,7 @@ class TopicLabeling():
                 self.publish_progress_callback(
                     stage="find_topics",
                     message=message,
-                    percent=3/7+((topic+1)/(7*total_topics)) # show the progress between 3/7 and 4/7
+                    percent=3/7+(done/(7*total_topics)) # show the progress between 3/7 and 4/7
                 )
 
             # Clean up bold markers if any.
@@ -777,9 +970,11 @@ class TopicLabeling():
                     
             representations[topic] = labels_list
 
+        representations = {topic: representations[topic] for topic in range(total_topics)}
 
         avg_time = total_time / total_topics
         print(f"LLM prediction stats:")
+        print(f"Wall time: {time.time() - wall_start:.2f} seconds")
         print(f"Total time: {total_time:.2f} seconds")
         print(f"Average time per topic: {avg_time:.2f} seconds")
         print(f"Number of topics: {total_topics}")
@@ -913,9 +1108,11 @@ Now produce one JSON array of three labels, e.g.: ["Label 1","Label 2","Label 3"
         self.prompts = prompts
 
 class GroupLabeling():
-    def __init__(self, df, topics, topic_labels, groups, topic_model, topic_labeler, config):
+    def __init__(self, df, topics, topic_labels, groups, topic_model, topic_labeler, config, population=None):
         self.df = df
         self.config = config
+        # Rows that matched before sampling; None when the dataset was not sampled.
+        self.population = population
         self.topics = topics
         self.groups = groups
         self.topic_labels = topic_labels
@@ -962,8 +1159,8 @@ class GroupLabeling():
         llm = Ollama(model="gemma3:27b", base_url=OLLAMA_IP, temperature=0.1)
         pattern = r"(?<=Group Label: )(.*)"
         
-        for group, prompt in tqdm(self.group_prompts.items(), desc="LLM group labels"):
-            response = llm.predict(prompt)
+        predictions = predict_concurrently(llm, self.group_prompts)
+        for group, response, _ in tqdm(predictions, total=len(self.group_prompts), desc="LLM group labels"):
             cleaned_response = response.replace('"', '')
             matches = re.findall(pattern, cleaned_response)
             if matches:
@@ -971,7 +1168,8 @@ class GroupLabeling():
             else:
                 # Fallback: assign the entire response as the label if no match is found.
                 labels[group] = cleaned_response
-        self.group_labels = labels
+        # Keep the groups in their original order regardless of which label came back first.
+        self.group_labels = {group: labels[group] for group in self.group_prompts}
 
 
     def create_topic_group_listing_json(self):
@@ -985,7 +1183,11 @@ class GroupLabeling():
             "subreddit": self.config.get("subreddit"),
             "option": self.config.get("option"),  # Indicates posts or comments.
             "startDate": self.config.get("startDate", ""),
-            "endDate": self.config.get("endDate", "")
+            "endDate": self.config.get("endDate", ""),
+            "sample": self.config.get("sample", ""),
+            "sample_seed": self.config.get("sample_seed", 0),
+            "sample_size": len(self.df),
+            "population": self.population if self.population is not None else len(self.df)
         }
         
         grouped_results = []  # List to hold one dictionary per group
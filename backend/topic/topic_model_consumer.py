@@ -53,6 +53,10 @@ def callback(ch, method, properties, body):
         config_copy["startDate"] = data["startDate"]
     if "endDate" in data:
         config_copy["endDate"] = data["endDate"]
+    if "sample" in data:
+        config_copy["sample"] = data["sample"]
+    if "sample_seed" in data:
+        config_copy["sample_seed"] = data["sample_seed"]
     if "save_dir" in data:
         config_copy["save_dir"] = data["save_dir"]
     if "date" in data:
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+import argparse
+import os
+from clickhouse_driver import Client
+
+# ── your ClickHouse connection settings ──
+CH_HOST     = os.getenv("CH_HOST", "127.0.0.1")
+CH_PORT     = os.getenv("CH_PORT", 9003)
+CH_DATABASE = os.getenv("CH_DATABASE", "default")
+CH_USER     = os.getenv("CH_USER", "default")
+CH_PASSWORD = os.getenv("CH_PASSWORD", "heyheyhey")
+
+# (table, text column) pairs searched by get_arrow/export_data via search_value.
+SEARCH_COLUMNS = [
+    ("reddit_comments", "body"),
+    ("reddit_submissions", "selftext"),
+]
+
+# Token bloom filter on lower(text): used by search_mode=word (hasToken(lower(col), ...)).
+# 32 KiB filter, 3 hash functions, one filter per granule.
+TOKEN_INDEX = "tokenbf_v1(32768, 3, 0)"
+# Optional ngram bloom filter on the raw text: lets plain LIKE '%term%' skip granules
+# for terms of at least 4 characters, at a noticeably larger index size.
+NGRAM_INDEX = "ngrambf_v1(4, 65536, 3, 0)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add full-text skip indexes to the Reddit tables.")
+    parser.add_argument("--ngram", action="store_true", help="also add ngram indexes for substring LIKE search")
+    parser.add_argument("--no-materialize", action="store_true",
+                        help="only index newly inserted parts; skip rebuilding existing ones")
+    args = parser.parse_args()
+
+    # ── connect ──
+    client = Client(
+        host=CH_HOST,
+        port=CH_PORT,
+        user=CH_USER,
+        password=CH_PASSWORD,
+        database=CH_DATABASE
+    )
+
+    for table, column in SEARCH_COLUMNS:
+        indexes = [(f"{column}_tokens", f"lower({column})", TOKEN_INDEX)]
+        if args.ngram:
+            indexes.append((f"{column}_ngrams", column, NGRAM_INDEX))
+
+        for name, expr, index_type in indexes:
+            client.execute(
+                f"ALTER TABLE {table} ADD INDEX IF NOT EXISTS {name} {expr} TYPE {index_type} GRANULARITY 1"
+            )
+            print(f"Added index `{name}` on {table}.{expr} if it did not exist.")
+
+            if not args.no_materialize:
+                # Runs as a mutation in the background; progress is in system.mutations.
+                client.execute(f"ALTER TABLE {table} MATERIALIZE INDEX {name}")
+                print(f"Started building `{name}` for existing parts of {table}.")
+
+    print("Done. Track index builds with: SELECT table, command, is_done FROM system.mutations WHERE NOT is_done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import time
+from clickhouse_driver import Client
+from time_projection import PROJECTION_NAME
+
+# ── your ClickHouse connection settings ──
+CH_HOST     = os.getenv("CH_HOST", "127.0.0.1")
+CH_PORT     = os.getenv("CH_PORT", 9003)
+CH_DATABASE = os.getenv("CH_DATABASE", "default")
+CH_USER     = os.getenv("CH_USER", "default")
+CH_PASSWORD = os.getenv("CH_PASSWORD", "heyheyhey")
+
+TEXT_COLUMNS = {"reddit_comments": "body", "reddit_submissions": "selftext"}
+
+
+def explain_granules(client, sql, params, settings):
+    """Return the read step and Granules lines of EXPLAIN indexes = 1 (parts/granules kept)."""
+    rows = client.execute(f"EXPLAIN indexes = 1 {sql}", params, settings=settings)
+    return [row[0].strip() for row in rows if "ReadFromMergeTree" in row[0] or "Granules" in row[0]]
+
+
+def run(client, label, sql, params, settings, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.time()
+        rows, chars = client.execute(sql, params, settings=settings)[0]
+        timings.append(time.time() - start)
+    progress = client.last_query.progress
+    print(f"\n== {label} ==")
+    print(f"rows in range: {rows:,} ({chars:,} characters of text)")
+    print(f"best of {repeats}: {min(timings):.3f}s  (read {progress.rows:,} rows, {progress.bytes / 1024 ** 2:,.1f} MiB)")
+    for line in explain_granules(client, sql, params, settings):
+        print(f"  {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a cross-subreddit date range with and without the time projection.")
+    parser.add_argument("--table", default="reddit_comments", choices=sorted(TEXT_COLUMNS))
+    parser.add_argument("--start", default="2024-01-15 00:00:00", help="range start, YYYY-MM-DD HH:MM:SS")
+    parser.add_argument("--end", default="2024-01-16 00:00:00", help="range end (exclusive)")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    client = Client(
+        host=CH_HOST,
+        port=CH_PORT,
+        user=CH_USER,
+        password=CH_PASSWORD,
+        database=CH_DATABASE
+    )
+
+    # Reads the text column like get_arrow does, so the granules skipped are real I/O saved.
+    sql = (
+        f"SELECT count(), sum(length({TEXT_COLUMNS[args.table]})) FROM {args.table} "
+        "WHERE created_utc >= toDateTime64(%(start)s, 3) AND created_utc < toDateTime64(%(end)s, 3)"
+    )
+    params = {"start": args.start, "end": args.end}
+
+    # Disable the query cache so every repeat really reads the parts.
+    base = {"use_query_cache": 0}
+    run(client, "before: (subreddit, created_utc) sort key", sql, params,
+        {**base, "optimize_use_projections": 0}, args.repeats)
+    run(client, f"after: projection {PROJECTION_NAME}", sql, params,
+        {**base, "optimize_use_projections": 1, "preferred_optimize_projection_name": PROJECTION_NAME},
+        args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+from clickhouse_driver import Client
+
+# Tokenize search terms exactly like the API does (backend/common/query_builder.py).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.query_builder import search_tokens
+
+# ── your ClickHouse connection settings ──
+CH_HOST     = os.getenv("CH_HOST", "127.0.0.1")
+CH_PORT     = os.getenv("CH_PORT", 9003)
+CH_DATABASE = os.getenv("CH_DATABASE", "default")
+CH_USER     = os.getenv("CH_USER", "default")
+CH_PASSWORD = os.getenv("CH_PASSWORD", "heyheyhey")
+
+TEXT_COLUMNS = {"reddit_comments": "body", "reddit_submissions": "selftext"}
+
+
+def explain_granules(client, sql, params, settings):
+    """Return the Skip index lines of EXPLAIN indexes = 1 (parts/granules kept)."""
+    rows = client.execute(f"EXPLAIN indexes = 1 {sql}", params, settings=settings)
+    return [row[0].strip() for row in rows if "Granules" in row[0] or "Name:" in row[0] or "Skip" in row[0]]
+
+
+def run(client, label, sql, params, settings, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.time()
+        count = client.execute(sql, params, settings=settings)[0][0]
+        timings.append(time.time() - start)
+    progress = client.last_query.progress
+    print(f"\n== {label} ==")
+    print(f"matches: {count:,}")
+    print(f"best of {repeats}: {min(timings):.3f}s  (read {progress.rows:,} rows, {progress.bytes / 1024 ** 2:,.1f} MiB)")
+    for line in explain_granules(client, sql, params, settings):
+        print(f"  {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare LIKE search with token-index search on one month partition.")
+    parser.add_argument("term", help="word or phrase to search for, e.g. ozempic")
+    parser.add_argument("--table", default="reddit_comments", choices=sorted(TEXT_COLUMNS))
+    parser.add_argument("--month", default="2024-01", help="partition to scan, YYYY-MM")
+    parser.add_argument("--subreddit", default="", help="optionally restrict to one subreddit")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    client = Client(
+        host=CH_HOST,
+        port=CH_PORT,
+        user=CH_USER,
+        password=CH_PASSWORD,
+        database=CH_DATABASE
+    )
+
+    column = TEXT_COLUMNS[args.table]
+    where = "toYYYYMM(created_utc) = %(partition)s"
+    params = {"partition": int(args.month.replace("-", "")), "pattern": f"%{args.term}%"}
+    if args.subreddit:
+        where += " AND subreddit = %(subreddit)s"
+        params["subreddit"] = args.subreddit
+
+    # hasToken only accepts a single token, so a phrase becomes one condition per token.
+    tokens = search_tokens(args.term)
+    if not tokens:
+        parser.error("term has no searchable tokens")
+    token_conditions = []
+    for i, token in enumerate(tokens):
+        token_conditions.append(f"hasToken(lower({column}), %(token_{i})s)")
+        params[f"token_{i}"] = token
+
+    like_sql = f"SELECT count() FROM {args.table} WHERE {where} AND {column} LIKE %(pattern)s"
+    token_sql = f"SELECT count() FROM {args.table} WHERE {where} AND {' AND '.join(token_conditions)}"
+
+    # Disable the query cache so every repeat really reads the partition.
+    base = {"use_query_cache": 0}
+    run(client, "before: LIKE '%term%'", like_sql, params, base, args.repeats)
+    run(client, "before: hasToken without skip indexes", token_sql, params, {**base, "use_skip_indexes": 0}, args.repeats)
+    run(client, "after: hasToken with skip indexes", token_sql, params, base, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import argparse
+import os
+from clickhouse_driver import Client
+
+# ── your ClickHouse connection settings ──
+CH_HOST     = os.getenv("CH_HOST", "127.0.0.1")
+CH_PORT     = os.getenv("CH_PORT", 9003)
+CH_DATABASE = os.getenv("CH_DATABASE", "default")
+CH_USER     = os.getenv("CH_USER", "default")
+CH_PASSWORD = os.getenv("CH_PASSWORD", "heyheyhey")
+
+# (table, text column) pairs that get a cleaned copy for topic modeling.
+TEXT_COLUMNS = {
+    "reddit_comments": "body",
+    "reddit_submissions": "selftext",
+}
+
+
+def clean_body_expr(column):
+    """
+    Same cleanup TopicModeling.preprocess_dataframe did in pandas: drop URLs, turn
+    escaped "\\n" into spaces, drop "&gt;" and collapse whitespace.
+    """
+    return (
+        "replaceRegexpAll(replaceAll(replaceAll("
+        rf"replaceRegexpAll({column}, 'http\\S+', ''), "
+        r"'\\n', ' '), '&gt;', ''), '\\s+', ' ')"
+    )
+
+
+def clean_columns_ddl(table):
+    """Column definitions for `clean_body` and `body_len`, computed by ClickHouse on insert."""
+    return (
+        f"clean_body String MATERIALIZED {clean_body_expr(TEXT_COLUMNS[table])} CODEC(ZSTD(7)),\n"
+        "                body_len UInt32 MATERIALIZED lengthUTF8(clean_body) CODEC(ZSTD(1))"
+    )
+
+
+def add_clean_columns(client, table, materialize=True):
+    """Add the cleaned-text columns to an existing table and optionally fill them for old parts."""
+    for definition in clean_columns_ddl(table).split(",\n"):
+        client.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {definition.strip()}")
+    print(f"Added clean_body/body_len to {table} if they did not exist.")
+
+    if materialize:
+        # Runs as a mutation in the background; progress is in system.mutations.
+        client.execute(f"ALTER TABLE {table} MATERIALIZE COLUMN clean_body")
+        client.execute(f"ALTER TABLE {table} MATERIALIZE COLUMN body_len")
+        print(f"Started computing clean_body/body_len for existing parts of {table}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the materialized clean_body/body_len columns.")
+    parser.add_argument("--no-materialize", action="store_true",
+                        help="only fill newly inserted parts; old parts compute the columns when read")
+    args = parser.parse_args()
+
+    # ── connect ──
+    client = Client(
+        host=CH_HOST,
+        port=CH_PORT,
+        user=CH_USER,
+        password=CH_PASSWORD,
+        database=CH_DATABASE
+    )
+
+    for table in TEXT_COLUMNS:
+        add_clean_columns(client, table, materialize=not args.no_materialize)
+
+    print("Done. Track the backfill with: SELECT table, command, is_done FROM system.mutations WHERE NOT is_done")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,13 @@ import os
 import json
 import signal
 import time
+import urllib.request
 from datetime import datetime, timezone
 from clickhouse_driver import Client
 from yaspin import yaspin
+from volume_views import create_volume_views
+from clean_body import clean_columns_ddl
+from time_projection import add_time_projection
 
 # Ignore SIGHUP so the process is less likely to die if SSH disconnects.
 signal.signal(signal.SIGHUP, signal.SIG_IGN)
@@ -24,6 +28,17 @@ CH_PASSWORD = "heyheyhey"
 # Batch size for inserts
 BATCH_SIZE = 300_000  # Insert rows in batches of 300k
 
+# Dashboard endpoint that drops cached get_arrow results for the ingested subreddits,
+# e.g. https://<host>/api/arrow_cache/invalidate. Skipped when unset.
+CACHE_INVALIDATE_URL = os.getenv("CACHE_INVALIDATE_URL", "")
+# Shared secret the endpoint checks; must match the app's CACHE_INVALIDATE_TOKEN.
+CACHE_INVALIDATE_TOKEN = os.getenv("CACHE_INVALIDATE_TOKEN", "")
+# Invalidate after this many inserted batches as well as at the end (0 = only at the end).
+CACHE_INVALIDATE_EVERY_BATCHES = int(os.getenv("CACHE_INVALIDATE_EVERY_BATCHES", 10))
+
+# Also keep the created_utc-ordered projection (time_projection.py) on the loaded table.
+TIME_PROJECTION = os.getenv("TIME_PROJECTION", "false").lower() == "true"
+
 def convert_unix_to_datetime64(unix_timestamp):
     """Converts a Unix timestamp to a timezone-aware datetime object with millisecond precision."""
     if isinstance(unix_timestamp, (int, float)):
@@ -34,6 +49,23 @@ def convert_unix_to_datetime64(unix_timestamp):
         return dt.replace(microsecond=truncated_microseconds)
     return datetime(1970, 1, 1, tzinfo=timezone.utc)
 
+def invalidate_arrow_cache(subreddits):
+    """Tell the dashboard which subreddits received new rows so stale cached results are dropped."""
+    if not CACHE_INVALIDATE_URL:
+        return
+    body = json.dumps({"subreddits": sorted(subreddits)}).encode("utf-8")
+    req = urllib.request.Request(
+        CACHE_INVALIDATE_URL,
+        data=body,
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {CACHE_INVALIDATE_TOKEN}"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            print(f"Invalidated Arrow cache for {len(subreddits):,} subreddits (HTTP {resp.status}).")
+    except Exception as e:
+        print(f"Warning: could not invalidate Arrow cache: {e}")
+
 def main():
     if len(sys.argv) < 2:
         print(f"Usage: {sys.argv[0]} /path/to/file.jsonl")
@@ -89,7 +121,7 @@ def main():
     # Create the appropriate table based on the file type.
     if file_type == 'comment':
         print("Creating table reddit_comments if it does not exist...")
-        client.execute('''
+        client.execute(f'''
             CREATE TABLE IF NOT EXISTS reddit_comments (
                 id String CODEC(ZSTD(9)),
                 author LowCardinality(String) CODEC(ZSTD(3)),
@@ -99,7 +131,9 @@ def main():
                 body String CODEC(ZSTD(7)),
                 created_utc DateTime64(3) CODEC(Delta, ZSTD(3)),
                 score Int32 CODEC(ZSTD(1)),
-                file_name LowCardinality(String) CODEC(ZSTD(3))
+                file_name LowCardinality(String) CODEC(ZSTD(3)),
+                {clean_columns_ddl('reddit_comments')},
+                INDEX body_tokens lower(body) TYPE tokenbf_v1(32768, 3, 0) GRANULARITY 1
             )
             ENGINE = MergeTree()
             PARTITION BY toYYYYMM(toDateTime64(created_utc, 3))
@@ -107,7 +141,7 @@ def main():
         ''')
     else:  # file_type == 'submission'
         print("Creating table reddit_submissions if it does not exist...")
-        client.execute('''
+        client.execute(f'''
             CREATE TABLE IF NOT EXISTS reddit_submissions (
                 id String CODEC(ZSTD(9)),
                 author LowCardinality(String) CODEC(ZSTD(3)),
@@ -116,16 +150,28 @@ def main():
                 selftext String CODEC(ZSTD(7)),
                 created_utc DateTime64(3) CODEC(Delta, ZSTD(3)),
                 score Int32 CODEC(ZSTD(1)),
-                file_name LowCardinality(String) CODEC(ZSTD(3))
+                file_name LowCardinality(String) CODEC(ZSTD(3)),
+                {clean_columns_ddl('reddit_submissions')},
+                INDEX selftext_tokens lower(selftext) TYPE tokenbf_v1(32768, 3, 0) GRANULARITY 1
             )
             ENGINE = MergeTree()
             PARTITION BY toYYYYMM(toDateTime64(created_utc, 3))
             ORDER BY (subreddit, created_utc)
         ''')
 
+    # Keep the pre-aggregated daily volume (used by /api/volume) in step with this table.
+    create_volume_views(client, ["reddit_comments" if file_type == 'comment' else "reddit_submissions"])
+    if TIME_PROJECTION:
+        # New parts get the projection as they are inserted; old parts are left to time_projection.py.
+        add_time_projection(client, "reddit_comments" if file_type == 'comment' else "reddit_submissions",
+                            materialize=False)
+
     # Prepare a single buffer and counter.
     buffer = []
     inserted_count = 0
+    batch_count = 0
+    # Subreddits with rows inserted since the cache was last invalidated.
+    ingested_subreddits = set()
 
     print(f"Reading {file_path}...")
     last_print_time = time.time()
@@ -136,58 +182,83 @@ def main():
     else:
         spinner = None
 
-    # Reopen the file to process all lines.
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line_num, line in enumerate(f, start=1):
-            line = line.strip()
-            if not line:
-                continue
+    try:
+        # Reopen the file to process all lines.
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line_num, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
 
-            if use_spinner and line_num % 100_000 == 0:
-                spinner.text = f"Processing lines: {line_num:,}/{line_count:,}"
-            elif not use_spinner and time.time() - last_print_time >= 60:
-                print(f"Processing lines: {line_num:,}/{line_count:,}")
-                last_print_time = time.time()
+                if use_spinner and line_num % 100_000 == 0:
+                    spinner.text = f"Processing lines: {line_num:,}/{line_count:,}"
+                elif not use_spinner and time.time() - last_print_time >= 60:
+                    print(f"Processing lines: {line_num:,}/{line_count:,}")
+                    last_print_time = time.time()
 
-            try:
-                record = json.loads(line)
-            except json.JSONDecodeError as e:
-                if use_spinner:
-                    spinner.write(f"Invalid JSON at line {line_num}: {e}")
-                else:
-                    print(f"Invalid JSON at line {line_num}: {e}")
-                continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    if use_spinner:
+                        spinner.write(f"Invalid JSON at line {line_num}: {e}")
+                    else:
+                        print(f"Invalid JSON at line {line_num}: {e}")
+                    continue
+
+                created_val = convert_unix_to_datetime64(record.get('created_utc', 0))
+                def safe_str(val):
+                    return '' if val is None else str(val)
 
-            created_val = convert_unix_to_datetime64(record.get('created_utc', 0))
-            def safe_str(val):
-                return '' if val is None else str(val)
-
-            if file_type == 'comment':
-                row = [
-                    safe_str(record.get('id')),
-                    safe_str(record.get('author')),
-                    safe_str(record.get('subreddit')),
-                    safe_str(record.get('link_id')),
-                    safe_str(record.get('parent_id')),
-                    safe_str(record.get('body')),
-                    created_val,
-                    int(record.get('score', 0)),
-                    file_basename
-                ]
-            else:  # file_type == 'submission'
-                row = [
-                    safe_str(record.get('id')),
-                    safe_str(record.get('author')),
-                    safe_str(record.get('subreddit')),
-                    safe_str(record.get('title')),
-                    safe_str(record.get('selftext')),
-                    created_val,
-                    int(record.get('score', 0)),
-                    file_basename
-                ]
-
-            buffer.append(row)
-            if len(buffer) >= BATCH_SIZE:
+                if file_type == 'comment':
+                    row = [
+                        safe_str(record.get('id')),
+                        safe_str(record.get('author')),
+                        safe_str(record.get('subreddit')),
+                        safe_str(record.get('link_id')),
+                        safe_str(record.get('parent_id')),
+                        safe_str(record.get('body')),
+                        created_val,
+                        int(record.get('score', 0)),
+                        file_basename
+                    ]
+                else:  # file_type == 'submission'
+                    row = [
+                        safe_str(record.get('id')),
+                        safe_str(record.get('author')),
+                        safe_str(record.get('subreddit')),
+                        safe_str(record.get('title')),
+                        safe_str(record.get('selftext')),
+                        created_val,
+                        int(record.get('score', 0)),
+                        file_basename
+                    ]
+
+                buffer.append(row)
+                ingested_subreddits.add(row[2])
+                if len(buffer) >= BATCH_SIZE:
+                    if file_type == 'comment':
+                        client.execute('''
+                            INSERT INTO reddit_comments
+                            (id, author, subreddit, link_id, parent_id, body, created_utc, score, file_name)
+                            VALUES
+                        ''', buffer)
+                    else:
+                        client.execute('''
+                            INSERT INTO reddit_submissions
+                            (id, author, subreddit, title, selftext, created_utc, score, file_name)
+                            VALUES
+                        ''', buffer)
+                    inserted_count += len(buffer)
+                    buffer.clear()
+                    batch_count += 1
+                    # Long loads also invalidate as they go, so results cached over partial
+                    # data do not outlive the rest of the load.
+                    if CACHE_INVALIDATE_EVERY_BATCHES and batch_count % CACHE_INVALIDATE_EVERY_BATCHES == 0:
+                        invalidate_arrow_cache(ingested_subreddits)
+                        ingested_subreddits.clear()
+
+            # Insert any remaining rows.
+            if buffer:
                 if file_type == 'comment':
                     client.execute('''
                         INSERT INTO reddit_comments
@@ -202,23 +273,11 @@ def main():
                     ''', buffer)
                 inserted_count += len(buffer)
                 buffer.clear()
-
-        # Insert any remaining rows.
-        if buffer:
-            if file_type == 'comment':
-                client.execute('''
-                    INSERT INTO reddit_comments
-                    (id, author, subreddit, link_id, parent_id, body, created_utc, score, file_name)
-                    VALUES
-                ''', buffer)
-            else:
-                client.execute('''
-                    INSERT INTO reddit_submissions
-                    (id, author, subreddit, title, selftext, created_utc, score, file_name)
-                    VALUES
-                ''', buffer)
-            inserted_count += len(buffer)
-            buffer.clear()
+    finally:
+        # Every flushed batch is already visible, so drop the stale results even when
+        # the load stops partway.
+        if ingested_subreddits:
+            invalidate_arrow_cache(ingested_subreddits)
 
     if use_spinner:
         spinner.ok(f"\nDone! Inserted {inserted_count:,} rows from {file_path} as {file_type}s.")
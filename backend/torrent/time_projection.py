@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+from clickhouse_driver import Client
+
+# Use the projection name the API asks for (backend/common/query_builder.py).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.query_builder import TIME_PROJECTION
+
+# ── your ClickHouse connection settings ──
+CH_HOST     = os.getenv("CH_HOST", "127.0.0.1")
+CH_PORT     = os.getenv("CH_PORT", 9003)
+CH_DATABASE = os.getenv("CH_DATABASE", "default")
+CH_USER     = os.getenv("CH_USER", "default")
+CH_PASSWORD = os.getenv("CH_PASSWORD", "heyheyhey")
+
+TABLES = ["reddit_comments", "reddit_submissions"]
+
+# A copy of every row sorted by created_utc alone. The tables are sorted by
+# (subreddit, created_utc), so a date range without a subreddit has to read every
+# subreddit's granules; the projection turns it into one contiguous range. It roughly
+# doubles each table's size on disk.
+PROJECTION_NAME = TIME_PROJECTION
+# Columns are listed because SELECT * leaves out MATERIALIZED ones, and clean=true
+# queries read clean_body/body_len (clean_body.py).
+PROJECTION_COLUMNS = {
+    "reddit_comments": ["id", "author", "subreddit", "link_id", "parent_id", "body",
+                        "created_utc", "score", "file_name"],
+    "reddit_submissions": ["id", "author", "subreddit", "title", "selftext",
+                           "created_utc", "score", "file_name"],
+}
+CLEAN_COLUMNS = ["clean_body", "body_len"]
+
+
+def projection_query(client, table):
+    """The projection's SELECT, with the cleaned-text columns when the table has them."""
+    existing = {name for name, in client.execute(
+        "SELECT name FROM system.columns WHERE database = currentDatabase() AND table = %(table)s",
+        {"table": table}
+    )}
+    columns = [name for name in PROJECTION_COLUMNS[table] + CLEAN_COLUMNS if name in existing]
+    if not set(CLEAN_COLUMNS) <= existing:
+        print(f"Warning: {table} has no clean_body/body_len; clean=true queries will not use "
+              f"`{PROJECTION_NAME}` until clean_body.py has run and it is added again with --replace.")
+    return f"SELECT {', '.join(columns)} ORDER BY created_utc"
+
+
+def add_time_projection(client, table, materialize=True, replace=False):
+    """Add the time-ordered projection; ClickHouse keeps it up to date on every insert."""
+    if replace:
+        client.execute(f"ALTER TABLE {table} DROP PROJECTION IF EXISTS {PROJECTION_NAME}")
+        print(f"Dropped projection `{PROJECTION_NAME}` from {table} if it existed.")
+    query = projection_query(client, table)
+    client.execute(f"ALTER TABLE {table} ADD PROJECTION IF NOT EXISTS {PROJECTION_NAME} ({query})")
+    print(f"Added projection `{PROJECTION_NAME}` to {table} if it did not exist.")
+
+    if materialize:
+        # Runs as a mutation in the background; progress is in system.mutations.
+        client.execute(f"ALTER TABLE {table} MATERIALIZE PROJECTION {PROJECTION_NAME}")
+        print(f"Started building `{PROJECTION_NAME}` for existing parts of {table}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add a created_utc-ordered projection to the Reddit tables.")
+    parser.add_argument("--table", action="append", choices=TABLES, help="only this table (repeatable)")
+    parser.add_argument("--no-materialize", action="store_true",
+                        help="only project newly inserted parts; skip rebuilding existing ones")
+    parser.add_argument("--replace", action="store_true",
+                        help="drop an existing projection first, e.g. one added before clean_body.py ran")
+    args = parser.parse_args()
+
+    # ── connect ──
+    client = Client(
+        host=CH_HOST,
+        port=CH_PORT,
+        user=CH_USER,
+        password=CH_PASSWORD,
+        database=CH_DATABASE
+    )
+
+    for table in args.table or TABLES:
+        add_time_projection(client, table, materialize=not args.no_materialize, replace=args.replace)
+
+    print("Done. Track projection builds with: SELECT table, command, is_done FROM system.mutations WHERE NOT is_done")
+    print("Then set CH_TIME_PROJECTION=true for the app so cross-subreddit date ranges use it.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import argparse
+import os
+from clickhouse_driver import Client
+
+# ── your ClickHouse connection settings ──
+CH_HOST     = os.getenv("CH_HOST", "127.0.0.1")
+CH_PORT     = os.getenv("CH_PORT", 9003)
+CH_DATABASE = os.getenv("CH_DATABASE", "default")
+CH_USER     = os.getenv("CH_USER", "default")
+CH_PASSWORD = os.getenv("CH_PASSWORD", "heyheyhey")
+
+# Raw table -> value stored in reddit_daily_volume.type
+VOLUME_SOURCES = {
+    "reddit_submissions": "submission",
+    "reddit_comments": "comment",
+}
+
+# One row per subreddit x day x type. SummingMergeTree adds up `posts` and merges the
+# uniq states in `authors` when parts are merged, so the table stays tiny compared to
+# the raw tables and /api/volume never has to read them.
+VOLUME_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS reddit_daily_volume (
+        subreddit LowCardinality(String),
+        day Date,
+        type LowCardinality(String),
+        posts UInt64,
+        authors AggregateFunction(uniq, String)
+    )
+    ENGINE = SummingMergeTree()
+    PARTITION BY toYYYYMM(day)
+    ORDER BY (subreddit, type, day)
+'''
+
+
+def volume_select(table):
+    """SELECT that aggregates `table` into reddit_daily_volume rows (same filter as get_arrow)."""
+    return f'''
+        SELECT
+            subreddit,
+            toDate(created_utc) AS day,
+            '{VOLUME_SOURCES[table]}' AS type,
+            count() AS posts,
+            uniqState(CAST(author AS String)) AS authors
+        FROM {table}
+        WHERE author != 'AutoModerator'
+    '''
+
+
+def create_volume_views(client, tables=None):
+    """Create reddit_daily_volume and the materialized views that fill it on insert."""
+    client.execute(VOLUME_TABLE_DDL)
+    for table in VOLUME_SOURCES if tables is None else tables:
+        client.execute(f'''
+            CREATE MATERIALIZED VIEW IF NOT EXISTS {table}_daily_volume_mv
+            TO reddit_daily_volume
+            AS {volume_select(table)}
+            GROUP BY subreddit, day
+        ''')
+        print(f"Materialized view `{table}_daily_volume_mv` is in place.")
+
+
+def existing_sources(client):
+    """Raw Reddit tables that exist in the current database."""
+    return [
+        row[0] for row in client.execute(
+            "SELECT name FROM system.tables WHERE database = currentDatabase() AND name IN %(names)s",
+            {"names": list(VOLUME_SOURCES)}
+        )
+    ]
+
+
+def backfill(client, tables, months=None):
+    """
+    Rebuild reddit_daily_volume from the raw tables one month at a time. Each month's
+    partition is dropped before it is re-aggregated, so reruns do not double count;
+    do not run this while insert_data.py is loading the same months.
+    """
+    if not months:
+        months = sorted({
+            int(row[0]) for row in client.execute(
+                "SELECT DISTINCT partition FROM system.parts "
+                "WHERE database = currentDatabase() AND active AND table IN %(names)s",
+                {"names": list(tables)}
+            )
+        })
+
+    for month in months:
+        client.execute(f"ALTER TABLE reddit_daily_volume DROP PARTITION {int(month)}")
+        for table in tables:
+            client.execute(f'''
+                INSERT INTO reddit_daily_volume
+                {volume_select(table)}
+                AND toYYYYMM(created_utc) = {int(month)}
+                GROUP BY subreddit, day
+            ''')
+        print(f"Backfilled reddit_daily_volume for {month}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the daily volume table/views and optionally backfill them.")
+    parser.add_argument("--backfill", action="store_true", help="re-aggregate existing rows into reddit_daily_volume")
+    parser.add_argument("--month", action="append", type=int, default=[],
+                        help="only backfill this YYYYMM partition (repeatable)")
+    args = parser.parse_args()
+
+    # ── connect ──
+    client = Client(
+        host=CH_HOST,
+        port=CH_PORT,
+        user=CH_USER,
+        password=CH_PASSWORD,
+        database=CH_DATABASE
+    )
+
+    tables = existing_sources(client)
+    create_volume_views(client, tables)
+    if args.backfill:
+        backfill(client, tables, args.month)
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -96,6 +96,69 @@ function Data() {
     "X-Client-ID": clientIdRef.current
   });
 
+  // Exports run as background jobs on the server; the file is downloaded once it is written.
+  const runExportJob = async (format, { subreddit, option, startDate, endDate, search_value }) => {
+    try {
+      const response = await fetch("/api/export_job", {
+        method: "POST",
+        headers: withClientHeaders({ "Content-Type": "application/json" }),
+        body: JSON.stringify({
+          format,
+          subreddit,
+          option,
+          startDate: startDate.toISOString(),
+          endDate: endDate.toISOString(),
+          search_value,
+          // Excel exports show times in the browser's timezone.
+          timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
+        })
+      });
+      if (!response.ok) throw new Error("Failed to start export.");
+
+      const { job_id } = await response.json();
+      handleNotify("Export started, the download will begin when it is ready.");
+
+      const interval = setInterval(async () => {
+        try {
+          const progressRes = await fetch(`/api/progress/${job_id}`, {
+            headers: withClientHeaders()
+          });
+          if (!progressRes.ok) {
+            const errorPayload = await progressRes.json().catch(() => ({}));
+            throw new Error(errorPayload.error || `Progress check failed (${progressRes.status})`);
+          }
+          const progress = await progressRes.json();
+
+          if (progress.stage === "error") {
+            clearInterval(interval);
+            setError(`Export failed: ${progress.message}`);
+          } else if (progress.stage === "done") {
+            clearInterval(interval);
+            const resultRes = await fetch(`/api/get_result/${job_id}`, {
+              headers: withClientHeaders()
+            });
+            if (!resultRes.ok) throw new Error(`Result fetch failed (${resultRes.status})`);
+            const { result } = await resultRes.json();
+            // Not a user gesture any more, so window.open would hit the popup blocker;
+            // a temporary download link starts the download in place instead.
+            const link = document.createElement("a");
+            link.href = `${result.download_url}?client_id=${encodeURIComponent(clientIdRef.current)}`;
+            link.download = "";
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+          }
+        } catch (err) {
+          clearInterval(interval);
+          setError(err.message);
+        }
+      }, 1000); // poll every second
+
+    } catch (err) {
+      setError(err.message);
+    }
+  };
+
 
   // Search History Variables
   const [isDeleting, setIsDeleting] = useState(false);
@@ -135,7 +198,7 @@ function Data() {
         url += `&search_value=${encodeURIComponent(searchValue)}`;
       }
 
-      const response = await fetch(url);
+      const response = await fetch(url, { headers: withClientHeaders() });
 
       // Get the binary data
       const arrayBuffer = await response.arrayBuffer();
@@ -486,13 +549,7 @@ function Data() {
             action: function () {
               const dt = $("#click-table").DataTable(); // Get the DataTables instance.
               const search_value = dt.search() || "";
-              window.open(
-                `/api/export_data?format=excel&subreddit=${subreddit}` +
-                `&option=${option}` +
-                `&startDate=${startDate.toISOString()}&endDate=${endDate.toISOString()}` +
-                `&search_value=${encodeURIComponent(search_value)}`,
-                '_blank'
-              );
+              runExportJob("excel", { subreddit, option, startDate, endDate, search_value });
             }
           },
           {
@@ -500,13 +557,7 @@ function Data() {
             action: function () {
               const dt = $("#click-table").DataTable(); // Get the DataTables instance.
               const search_value = dt.search() || "";
-              window.open(
-                `/api/export_data?format=csv&subreddit=${subreddit}` +
-                `&option=${option}` +
-                `&startDate=${startDate.toISOString()}&endDate=${endDate.toISOString()}` +
-                `&search_value=${encodeURIComponent(search_value)}`,
-                '_blank'
-              );
+              runExportJob("csv", { subreddit, option, startDate, endDate, search_value });
             }
           },
           {
@@ -514,13 +565,7 @@ function Data() {
             action: function () {
               const dt = $("#click-table").DataTable(); // Get the DataTables instance.
               const search_value = dt.search() || "";
-              window.open(
-                `/api/export_data?format=json&subreddit=${subreddit}` +
-                `&option=${option}` +
-                `&startDate=${startDate.toISOString()}&endDate=${endDate.toISOString()}` +
-                `&search_value=${encodeURIComponent(search_value)}`,
-                '_blank'
-              );
+              runExportJob("json", { subreddit, option, startDate, endDate, search_value });
             }
           },
           {
@@ -689,6 +734,26 @@ function Data() {
         setProgressPercent(0);
 
         try {
+            // Warn before long jobs and offer to model a sample instead.
+            let sample;
+            const estimateRes = await fetch(
+                `/api/estimate?subreddit=${encodeURIComponent(subreddit)}&option=${encodeURIComponent(options)}` +
+                `&startDate=${encodeURIComponent(startDate.toISOString())}&endDate=${encodeURIComponent(endDate.toISOString())}`,
+                { headers: withClientHeaders() }
+            );
+            if (estimateRes.ok) {
+                const estimate = await estimateRes.json();
+                if (estimate.topic_job_warning && estimate.suggested_sample) {
+                    const hours = (estimate.topic_job_seconds / 3600).toFixed(1);
+                    const useSample = window.confirm(
+                        `This selection has about ${estimate.rows.toLocaleString()} rows and topic modeling ` +
+                        `would take roughly ${hours} hours.\n\nPress OK to model a random sample of ` +
+                        `${estimate.suggested_sample.toLocaleString()} rows instead, or Cancel to use every row.`
+                    );
+                    if (useSample) sample = estimate.suggested_sample;
+                }
+            }
+
             // Submit the job
             const response = await fetch("/api/run_topic", {
                 method: "POST",
@@ -697,7 +762,8 @@ function Data() {
                     subreddit,
                     option: options,
                     startDate: startDate.toISOString(),
-                    endDate: endDate.toISOString()
+                    endDate: endDate.toISOString(),
+                    ...(sample ? { sample } : {})
                 })
             });
 